@@ -0,0 +1,50 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+import certifi
+import os
+from dotenv import load_dotenv
+
+from services.earnings import backfill_earnings
+from services.geo import backfill_locations
+from services.reputation import backfill_reputation
+from services.revenue import backfill_commissions
+from services.search import backfill_search_keys
+from services.support import backfill_unread
+
+async def run_backfills():
+    load_dotenv()
+    MONGO_URL = os.environ.get("MONGO_URL")
+    DB_NAME = os.environ.get("DB_NAME", "myshifters")
+
+    if not MONGO_URL:
+        print("Error: MONGO_URL not found in .env")
+        return
+
+    print(f"Connecting to MongoDB...")
+    try:
+        client = AsyncIOMotorClient(MONGO_URL, tls=True, tlsCAFile=certifi.where())
+        db = client[DB_NAME]
+
+        count = await backfill_earnings(db)
+        print(f"Earnings ledger: {count} applications synced.")
+
+        count = await backfill_commissions(db)
+        print(f"Revenue rollups: {count} completed applications recorded.")
+
+        count = await backfill_search_keys(db)
+        print(f"Search keys: {count} documents indexed.")
+
+        count = await backfill_locations(db)
+        print(f"Locations: {count} users and shifts geocoded.")
+
+        count = await backfill_reputation(db)
+        print(f"Reputation: {count} workers recomputed (completed shifts, rating, badges).")
+
+        count = await backfill_unread(db)
+        print(f"Support: {count} threads with unread counters initialised.")
+
+    except Exception as e:
+        print(f"Error: {e}")
+
+if __name__ == "__main__":
+    asyncio.run(run_backfills())
@@ -0,0 +1,34 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+import certifi
+import os
+import sys
+from dotenv import load_dotenv
+
+from services.indexes import ensure_indexes, find_collection_scans
+
+async def check_indexes():
+    load_dotenv()
+    MONGO_URL = os.environ.get("MONGO_URL")
+    DB_NAME = os.environ.get("DB_NAME", "myshifters")
+
+    if not MONGO_URL:
+        print("Error: MONGO_URL not found in .env")
+        return 1
+
+    print(f"Connecting to MongoDB...")
+    client = AsyncIOMotorClient(MONGO_URL, tls=True, tlsCAFile=certifi.where())
+    db = client[DB_NAME]
+
+    await ensure_indexes(db)
+    offenders = await find_collection_scans(db)
+    for query in offenders:
+        print(f"COLLSCAN: {query}")
+    if offenders:
+        print(f"{len(offenders)} hot queries are not served by an index.")
+        return 1
+    print("All hot queries are served by an index.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(check_indexes()))
@@ -1,8 +1,10 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, UploadFile, File, Form, Header, Query, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from fastapi.responses import StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
 import certifi
 import os
 import logging
@@ -12,7 +14,6 @@ from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone, timedelta
 import jwt
-import bcrypt
 from enum import Enum
 import base64
 import json
@@ -20,8 +21,28 @@ import secrets
 import string
 import re
 import cloudinary
-import cloudinary.uploader
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from services.admin_stats import AdminStatsService
+from services.audit import AuditLogWriter
+from services.counters import get_worker_counters, record_application_created, record_status_change
+from services.earnings import get_worker_earnings_summary, remove_shift_earnings, sync_earning
+from services.exports import date_range_filter, field, stream_csv
+from services.geo import coordinates, haversine_km, load_postal_codes, location_of, parse_near, refresh_location, with_location, within_radius
+from services.inbox import get_hotel_inbox
+from services.indexes import ensure_indexes
+from services.pagination import KEYSET_SORT, CountCache, keyset_filter, keyset_page, merge_filters, split_page
+from services.passwords import PasswordHasher
+from services.reputation import REPUTATION_FIELDS, rating_distribution, record_completion_change, record_rating_change
+from services.response_cache import ResponseCache
+from services.revenue import get_revenue_summary, remove_shift_commissions, sync_commission
+from services.search import add_search_keys, ranked_search_pipeline, refresh_search_keys, search_filter, search_terms
+from services.support import THREAD_EVENT_FIELDS, create_thread, get_messages_page, mark_read, post_message, thread_filter, unread_counts
+from services.support_events import ADMIN_INBOX, LocalBackend, MongoChangeStreamBackend, SupportBroker, thread_topic
+from services.uploads import CloudinaryStorage, LocalStorage, UploadService
+from services.user_cache import UserCache
+from services.worker_index import WorkerIndex, department_of
 
 # -----------------------------
 # Setup / Env
@@ -59,6 +80,8 @@ cloudinary.config(
 app = FastAPI(title="MyShifters API")
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
+# Flux SSE : EventSource ne sait pas envoyer d'en-tête Authorization, le jeton peut passer en query
+stream_security = HTTPBearer(auto_error=False)
 
 def parse_cors(origins_raw: str) -> List[str]:
     if not origins_raw or origins_raw == "*":
@@ -74,6 +97,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "ETag", "X-Since-Cursor", "X-Before-Cursor"],
 )
 
 try:
@@ -85,6 +109,78 @@ except Exception as e:
 
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
+# Ticket EventSource : l'URL finit dans les logs d'accès, on n'y met jamais le JWT de session
+STREAM_TICKET_PURPOSE = "support_stream"
+STREAM_TICKET_SECONDS = int(get_env("STREAM_TICKET_SECONDS", default="60"))
+
+admin_stats_cache = AdminStatsService(ttl_seconds=int(get_env("ADMIN_STATS_TTL_SECONDS", default="30")))
+password_hasher = PasswordHasher(
+    rounds=int(get_env("BCRYPT_ROUNDS", default="12")),
+    max_concurrency=int(get_env("PASSWORD_HASH_CONCURRENCY", default="4")),
+    queue_timeout=float(get_env("PASSWORD_HASH_QUEUE_TIMEOUT", default="5"))
+)
+
+# Stockage des fichiers : Cloudinary en production, disque local pour le dev / les tests
+STORAGE_BACKEND = get_env("STORAGE_BACKEND", default="cloudinary")
+LOCAL_UPLOAD_DIR = get_env("LOCAL_UPLOAD_DIR", default=str(Path(__file__).parent / "uploads"))
+if STORAGE_BACKEND == "local":
+    storage = LocalStorage(LOCAL_UPLOAD_DIR, get_env("LOCAL_UPLOAD_URL", default="/uploads"))
+else:
+    storage = CloudinaryStorage()
+upload_service = UploadService(storage, max_concurrency=int(get_env("UPLOAD_CONCURRENCY", default="4")))
+count_cache = CountCache(ttl_seconds=int(get_env("COUNT_CACHE_TTL_SECONDS", default="15")))
+user_cache = UserCache(
+    max_size=int(get_env("USER_CACHE_MAX_SIZE", default="5000")),
+    ttl_seconds=int(get_env("USER_CACHE_TTL_SECONDS", default="60"))
+)
+audit_log = AuditLogWriter(
+    batch_size=int(get_env("AUDIT_BATCH_SIZE", default="100")),
+    flush_interval=float(get_env("AUDIT_FLUSH_INTERVAL_SECONDS", default="1")),
+    max_queue=int(get_env("AUDIT_MAX_QUEUE", default="5000"))
+)
+# Table fine des codes postaux (optionnelle) ; sinon géocodage au centre du département
+if get_env("POSTAL_CODES_FILE"):
+    load_postal_codes(get_env("POSTAL_CODES_FILE"))
+shift_feed_cache = ResponseCache(ttl_seconds=int(get_env("SHIFT_FEED_TTL_SECONDS", default="60")))
+reviews_cache = ResponseCache(ttl_seconds=int(get_env("REVIEWS_CACHE_TTL_SECONDS", default="300")), max_age=60)
+PUBLIC_REVIEWS_MAX_LIMIT = 100
+worker_index = WorkerIndex(max_age_seconds=int(get_env("WORKER_INDEX_MAX_AGE_SECONDS", default="600")))
+# Push support : "local" (un seul process) ou "mongo" (change stream partagé entre process)
+SUPPORT_EVENTS_BACKEND = get_env("SUPPORT_EVENTS_BACKEND", default="local")
+support_broker = SupportBroker(
+    backend=MongoChangeStreamBackend(db) if SUPPORT_EVENTS_BACKEND == "mongo" and db is not None else LocalBackend(),
+    queue_size=int(get_env("SUPPORT_EVENTS_QUEUE_SIZE", default="100"))
+)
+
+@app.on_event("startup")
+async def create_indexes():
+    if db is None: return
+    await ensure_indexes(db)
+
+@app.on_event("startup")
+async def start_audit_log():
+    if db is None: return
+    audit_log.start(db)
+
+@app.on_event("startup")
+async def load_worker_index():
+    if db is None: return
+    try:
+        count = await worker_index.load(db)
+        logger.info(f"Worker index loaded: {count} workers")
+    except Exception as e:
+        # L'index se reconstruira à la première requête de matching
+        logger.error(f"Worker index load failed: {e}")
+
+@app.on_event("startup")
+async def start_support_broker():
+    await support_broker.start()
+
+@app.on_event("shutdown")
+async def drain_background_tasks():
+    await upload_service.drain()
+    await audit_log.close()
+    await support_broker.stop()
 
 class DateUtils:
     @staticmethod
@@ -94,10 +190,20 @@ class DateUtils:
         if dt is None: return None
         return dt.isoformat() if not isinstance(dt, str) else dt
 
+# Champs tenus par le serveur (identité, statut, réputation, géocodage, recherche) : ignorés dans les payloads utilisateur
+PROTECTED_USER_FIELDS = {"_id", "id", "email", "role", "password_hash", "verification_status", "is_suspended",
+                         "location", "search_words", "search_prefixes", *REPUTATION_FIELDS}
+
+def user_writable(payload: Dict) -> Dict:
+    return {k: v for k, v in payload.items() if k not in PROTECTED_USER_FIELDS}
+
 def clean_mongo_doc(doc: dict) -> dict:
     if not doc:
         return doc
     doc = doc.copy()
+    # Clés de recherche internes, jamais exposées par l'API
+    doc.pop("search_words", None)
+    doc.pop("search_prefixes", None)
     if "_id" in doc:
         if "id" not in doc:
             doc["id"] = str(doc["_id"])
@@ -155,14 +261,40 @@ def create_access_token(data: dict):
     to_encode.update({"exp": datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)})
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def create_stream_ticket(user_id: str) -> str:
+    payload = {"user_id": user_id, "purpose": STREAM_TICKET_PURPOSE,
+               "exp": datetime.now(timezone.utc) + timedelta(seconds=STREAM_TICKET_SECONDS)}
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+async def user_from_token(token: str, purpose: Optional[str] = None) -> dict:
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({"id": payload.get("user_id")})
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        # Un ticket de flux n'ouvre pas l'API, un JWT de session n'ouvre pas les flux par l'URL
+        if payload.get("purpose") != purpose: raise HTTPException(status_code=401, detail="Invalid token")
+        user = await user_cache.get(db, payload.get("user_id"))
         if not user: raise HTTPException(status_code=401, detail="User not found")
         return user
     except: raise HTTPException(status_code=401, detail="Invalid token")
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await user_from_token(credentials.credentials)
+
+async def get_stream_user(
+    ticket: Optional[str] = Query(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(stream_security)
+):
+    """EventSource n'envoie pas d'en-têtes : ticket court en query (POST /support/stream-ticket)"""
+    if credentials:
+        return await user_from_token(credentials.credentials)
+    if not ticket:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await user_from_token(ticket, purpose=STREAM_TICKET_PURPOSE)
+
+async def refresh_worker(worker_id: str) -> None:
+    """Après une mise à jour de la réputation : caches du document worker"""
+    await worker_index.refresh(db, worker_id)
+    user_cache.invalidate(worker_id)
+
 async def require_admin(current_user: dict = Depends(get_current_user)):
     if current_user.get("role") != UserRole.ADMIN: raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
@@ -179,7 +311,7 @@ async def register(userData: Dict[Any, Any]):
     if existing: raise HTTPException(status_code=400, detail="Email already registered")
     password = userData.get("password")
     if not password: raise HTTPException(status_code=400, detail="Password is required")
-    password_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    password_hash = await password_hasher.hash(password)
     new_user = {
         "id": str(uuid.uuid4()), "email": email, "password_hash": password_hash,
         "role": userData.get("role", "worker"), "first_name": userData.get("first_name"),
@@ -188,10 +320,16 @@ async def register(userData: Dict[Any, Any]):
         "phone": userData.get("phone"), "verification_status": "pending",
         "created_at": DateUtils.to_iso(DateUtils.now())
     }
-    for k, v in userData.items():
+    for k, v in user_writable(userData).items():
         if k not in ["password", "confirmPassword", "email", "role", "first_name", "last_name", "hotel_name", "city", "postal_code", "phone"]:
             new_user[k] = v
-    await db.users.insert_one(new_user)
+    try:
+        await db.users.insert_one(add_search_keys("users", with_location(new_user)))
+    except DuplicateKeyError:
+        # Deux inscriptions simultanées : l'index unique sur l'email tranche
+        raise HTTPException(status_code=400, detail="Email already registered")
+    worker_index.upsert(new_user)
+    admin_stats_cache.invalidate()
     token = create_access_token({"user_id": new_user["id"], "role": new_user["role"]})
     return {"token": token, "user": clean_mongo_doc({k: v for k, v in new_user.items() if k != "password_hash"})}
 
@@ -208,14 +346,8 @@ async def register_worker(
     if db is None: raise HTTPException(status_code=500, detail="Database connection failed")
     existing = await db.users.find_one({"email": email})
     if existing: raise HTTPException(status_code=400, detail="Email already registered")
-    password_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-    cv_url = None
-    if cv_pdf:
-        try:
-            upload_result = cloudinary.uploader.upload(cv_pdf.file)
-            cv_url = upload_result.get("secure_url")
-        except Exception as e: logger.error(f"Failed to upload CV: {e}")
-    
+    password_hash = await password_hasher.hash(password)
+
     try:
         skills_list = json.loads(skills)
     except:
@@ -226,25 +358,37 @@ async def register_worker(
         "first_name": first_name, "last_name": last_name, "phone": phone, "address": address,
         "city": city, "postal_code": postal_code, "experience_years": int(experience_years) if experience_years else 0,
         "has_ae_status": has_ae_status.lower() == "true", "siret": siret, "billing_address": billing_address,
-        "billing_city": billing_city, "billing_postal_code": billing_postal_code, "cv_url": cv_url,
+        "billing_city": billing_city, "billing_postal_code": billing_postal_code,
         "skills": skills_list,
         "verification_status": "pending", "created_at": DateUtils.to_iso(DateUtils.now())
     }
     
-    # Enregistrer le CV comme document initial si présent
-    if cv_url:
+    new_user = {k: v for k, v in new_user.items() if v is not None}
+    try:
+        await db.users.insert_one(add_search_keys("users", with_location(new_user)))
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    worker_index.upsert(new_user)
+    admin_stats_cache.invalidate()
+
+    # Enregistrer le CV comme document initial si présent (URL renseignée à la fin du transfert)
+    if cv_pdf:
         cv_doc = {
             "id": str(uuid.uuid4()),
             "user_id": new_user["id"],
             "type": "cv",
-            "url": cv_url,
+            "url": None,
             "status": "pending",
+            "upload_status": "pending",
             "created_at": DateUtils.to_iso(DateUtils.now())
         }
-        await db.documents.insert_one(cv_doc)
-
-    new_user = {k: v for k, v in new_user.items() if v is not None}
-    await db.users.insert_one(new_user)
+        try:
+            await db.documents.insert_one(cv_doc)
+            await upload_service.submit(db, new_user["id"], "cv", cv_pdf, [
+                ("documents", {"id": cv_doc["id"]}, "url", "upload_status"),
+                ("users", {"id": new_user["id"]}, "cv_url", None),
+            ], on_complete=lambda: user_cache.invalidate(new_user["id"]))
+        except Exception as e: logger.error(f"Failed to upload CV: {e}")
     token = create_access_token({"user_id": new_user["id"], "role": new_user["role"]})
     return {"token": token, "user": clean_mongo_doc({k: v for k, v in new_user.items() if k != "password_hash"})}
 
@@ -258,8 +402,10 @@ async def login(credentials: UserLogin):
     # Vérification robuste avec bcrypt et fallback texte brut
     is_valid = False
     try:
-        if bcrypt.checkpw(credentials.password.encode("utf-8"), stored_hash.encode("utf-8")):
+        if await password_hasher.verify(credentials.password, stored_hash):
             is_valid = True
+    except HTTPException:
+        raise
     except Exception as e:
         logger.warning(f"Bcrypt check failed for {credentials.email}, checking plain text: {e}")
         if credentials.password == stored_hash:
@@ -267,6 +413,12 @@ async def login(credentials: UserLogin):
 
     if not is_valid:
         raise HTTPException(status_code=401, detail="Invalid email or password")
+    # Alimente le compteur "utilisateurs actifs sur 7 jours" du dashboard admin
+    update = {"last_seen_at": DateUtils.to_iso(DateUtils.now())}
+    # Re-hash transparent si le coût bcrypt a changé (ou si le mot de passe était stocké en clair)
+    if password_hasher.needs_rehash(stored_hash):
+        update["password_hash"] = await password_hasher.hash(credentials.password)
+    await db.users.update_one({"id": user["id"]}, {"$set": update})
     token = create_access_token({"user_id": user["id"], "role": user["role"]})
     return {"token": token, "user": clean_mongo_doc({k: v for k, v in user.items() if k != "password_hash"})}
 
@@ -282,9 +434,15 @@ async def get_worker_profile(current_user: dict = Depends(get_current_user)):
 @api_router.put("/worker/profile")
 async def update_worker_profile(payload: Dict[Any, Any], current_user: dict = Depends(get_current_user)):
     if current_user["role"] != UserRole.WORKER: raise HTTPException(status_code=403)
-    # Ne pas autoriser la modification de l'email ou du role ici
-    update_data = {k: v for k, v in payload.items() if k not in ["id", "email", "role", "password_hash"]}
+    # Ni l'email, ni le role, ni les champs calculés (réputation, position...) ici
+    update_data = user_writable(payload)
+    if not update_data:
+        return {"status": "success"}
     await db.users.update_one({"id": current_user["id"]}, {"$set": update_data})
+    await refresh_search_keys(db, "users", {"id": current_user["id"]}, update_data.keys())
+    await refresh_location(db, "users", {"id": current_user["id"]}, update_data.keys())
+    await worker_index.refresh(db, current_user["id"], update_data.keys())
+    user_cache.invalidate(current_user["id"])
     return {"status": "success"}
 
 @api_router.get("/worker/experiences")
@@ -312,19 +470,22 @@ async def get_worker_documents(current_user: dict = Depends(get_current_user)):
 
 @api_router.post("/worker/documents")
 async def upload_worker_document(file: UploadFile = File(...), type: str = Form(...), current_user: dict = Depends(get_current_user)):
+    doc = {
+        "id": str(uuid.uuid4()),
+        "user_id": current_user["id"],
+        "type": type,
+        "url": None,
+        "status": "pending",
+        "upload_status": "pending",
+        "mime_type": file.content_type,
+        "created_at": DateUtils.to_iso(DateUtils.now())
+    }
     try:
-        upload_result = cloudinary.uploader.upload(file.file)
-        url = upload_result.get("secure_url")
-        doc = {
-            "id": str(uuid.uuid4()),
-            "user_id": current_user["id"],
-            "type": type,
-            "url": url,
-            "status": "pending",
-            "mime_type": file.content_type,
-            "created_at": DateUtils.to_iso(DateUtils.now())
-        }
         await db.documents.insert_one(doc)
+        job = await upload_service.submit(db, current_user["id"], "document", file, [
+            ("documents", {"id": doc["id"]}, "url", "upload_status"),
+        ])
+        doc["upload_id"] = job["id"]
         return clean_mongo_doc(doc)
     except Exception as e:
         logger.error(f"Failed to upload document: {e}")
@@ -363,7 +524,13 @@ async def get_worker_business(current_user: dict = Depends(get_current_user)):
 
 @api_router.put("/worker/ae-billing")
 async def update_worker_business(payload: Dict[Any, Any], current_user: dict = Depends(get_current_user)):
+    payload = user_writable(payload)
+    if not payload:
+        return {"status": "success"}
     await db.users.update_one({"id": current_user["id"]}, {"$set": payload})
+    await refresh_search_keys(db, "users", {"id": current_user["id"]}, payload.keys())
+    await worker_index.refresh(db, current_user["id"], payload.keys())
+    user_cache.invalidate(current_user["id"])
     return {"status": "success"}
 
 # Shifts
@@ -381,46 +548,124 @@ async def create_shift(payload: ShiftCreate, current_user: dict = Depends(get_cu
         hotel_city=current_user.get("city"), 
         **data
     )
-    await db.shifts.insert_one(new_shift.model_dump())
+    shift_doc = new_shift.model_dump()
+    # Position de l'hôtel, pour le filtre de proximité du feed
+    location = current_user.get("location") or location_of(current_user.get("postal_code"))
+    if location:
+        shift_doc["location"] = location
+    await db.shifts.insert_one(add_search_keys("shifts", shift_doc))
+    shift_feed_cache.invalidate()
+    admin_stats_cache.invalidate()
     return new_shift
 
 @api_router.get("/shifts")
-async def get_shifts(service_type: Optional[str] = None):
+async def get_shifts(
+    response: Response,
+    service_type: Optional[str] = None,
+    near: Optional[str] = Query(None, description="Code postal ou 'lat,lon'"),
+    radius_km: float = Query(25, gt=0, le=500),
+    limit: int = Query(100, ge=1, le=200),
+    after: Optional[str] = Query(None, description="Curseur X-Next-Cursor de la page précédente"),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Feed public des missions ouvertes ; sans filtre de proximité, servi depuis un cache invalidé à chaque écriture"""
+    origin = parse_near(near) if near else None
+    key = (service_type, limit, after)
+    entry = None if origin else shift_feed_cache.get(key)
+    if entry:
+        return shift_feed_cache.respond(entry, if_none_match)
+    generation = shift_feed_cache.generation
     query = {"status": ShiftStatus.OPEN}
     if service_type:
         query["service_type"] = service_type
-    shifts = await db.shifts.find(query).sort("created_at", -1).to_list(100)
-    return [clean_mongo_doc(s) for s in shifts]
+    if origin:
+        query.update(within_radius(*origin, radius_km))
+    query = merge_filters(query, keyset_filter(after))
+    shifts = await db.shifts.find(query).sort(KEYSET_SORT).to_list(limit + 1)
+    shifts, next_cursor = split_page(shifts, limit)
+    shifts = [clean_mongo_doc(s) for s in shifts]
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    if origin:
+        for shift in shifts:
+            coords = coordinates(shift.get("location"))
+            shift["distance_km"] = round(float(haversine_km(*origin, *coords)), 1) if coords else None
+        response.headers.update(headers)
+        return shifts
+    return shift_feed_cache.respond(shift_feed_cache.put(key, shifts, generation, headers), if_none_match)
 
 @api_router.get("/shifts/hotel")
 async def get_hotel_shifts(
+    response: Response,
     current_user: dict = Depends(get_current_user),
-    status: Optional[str] = Query(None)
+    status: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=200),
+    after: Optional[str] = Query(None)
 ):
     query = {"hotel_id": current_user["id"]}
     if status:
         query["status"] = status
-    shifts = await db.shifts.find(query).sort("created_at", -1).to_list(100)
-    result = []
-    for shift in shifts:
-        shift = clean_mongo_doc(shift)
-        # Récupérer le worker assigné si mission completée
-        if shift.get("status") in ["completed", "filled"]:
-            accepted_app = await db.applications.find_one({"shift_id": shift["id"], "status": {"$in": ["accepted", "completed"]}})
-            if accepted_app:
-                worker = await db.users.find_one({"id": accepted_app.get("worker_id")}, {"password_hash": 0})
-                if worker:
-                    shift["worker_id"] = worker.get("id")
-                    shift["worker_name"] = f"{worker.get('first_name','')} {worker.get('last_name','')}".strip()
-                    shift["worker_email"] = worker.get("email")
-        result.append(shift)
-    return result
+    query = merge_filters(query, keyset_filter(after))
+    shifts = await db.shifts.find(query).sort(KEYSET_SORT).to_list(limit + 1)
+    shifts, next_cursor = split_page(shifts, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    shifts = [clean_mongo_doc(s) for s in shifts]
+    # Récupérer en lot le worker assigné des missions pourvues / complétées
+    staffed_ids = [s["id"] for s in shifts if s.get("status") in ["completed", "filled"]]
+    if staffed_ids:
+        accepted_apps = await db.applications.find(
+            {"shift_id": {"$in": staffed_ids}, "status": {"$in": ["accepted", "completed"]}},
+            {"shift_id": 1, "worker_id": 1}
+        ).to_list(None)
+        worker_by_shift = {}
+        for a in accepted_apps:
+            worker_by_shift.setdefault(a["shift_id"], a.get("worker_id"))
+        workers = await db.users.find(
+            {"id": {"$in": list(set(worker_by_shift.values()))}},
+            {"id": 1, "first_name": 1, "last_name": 1, "email": 1}
+        ).to_list(None)
+        workers = {w["id"]: w for w in workers}
+        for shift in shifts:
+            worker = workers.get(worker_by_shift.get(shift["id"]))
+            if worker:
+                shift["worker_id"] = worker.get("id")
+                shift["worker_name"] = f"{worker.get('first_name','')} {worker.get('last_name','')}".strip()
+                shift["worker_email"] = worker.get("email")
+    return shifts
 
 @api_router.delete("/shifts/{shift_id}")
 async def delete_shift(shift_id: str, current_user: dict = Depends(get_current_user)):
-    await db.shifts.delete_one({"id": shift_id, "hotel_id": current_user["id"]})
+    result = await db.shifts.delete_one({"id": shift_id, "hotel_id": current_user["id"]})
+    if result.deleted_count:
+        # Une mission supprimée ne compte plus dans les gains ni dans le chiffre d'affaires
+        await remove_shift_earnings(db, shift_id)
+        await remove_shift_commissions(db, shift_id)
+    shift_feed_cache.invalidate()
+    admin_stats_cache.invalidate()
     return {"status": "success"}
 
+@api_router.get("/shifts/{shift_id}/candidates")
+async def get_candidates(
+    shift_id: str,
+    current_user: dict = Depends(get_current_user),
+    k: int = Query(20, ge=1, le=200),
+    area: str = Query("city", pattern="^(city|department|all)$", description="Zone de recherche autour de l'hôtel")
+):
+    """Meilleurs workers pour un shift : compétence requise, zone de l'hôtel, puis score de matching"""
+    shift = await db.shifts.find_one({"id": shift_id}, {**SHIFT_SUMMARY_PROJECTION, "location": 1})
+    if not shift:
+        raise HTTPException(status_code=404, detail="Mission non trouvée")
+    if current_user["role"] != UserRole.ADMIN and shift.get("hotel_id") != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Non autorisé")
+    await worker_index.ensure_loaded(db)
+    city = department = None
+    if area == "city":
+        city = shift.get("hotel_city")
+    elif area == "department":
+        hotel = await db.users.find_one({"id": shift.get("hotel_id")}, {"postal_code": 1})
+        department = department_of((hotel or {}).get("postal_code"))
+    return {"shift_id": shift_id, "area": area, "candidates": worker_index.rank(shift, k, city=city, department=department)}
+
 # Applications
 @api_router.post("/applications")
 async def apply_to_shift(payload: Dict[Any, Any], current_user: dict = Depends(get_current_user)):
@@ -441,46 +686,81 @@ async def apply_to_shift(payload: Dict[Any, Any], current_user: dict = Depends(g
         "status": ApplicationStatus.PENDING,
         "created_at": DateUtils.to_iso(DateUtils.now())
     }
-    await db.applications.insert_one(app)
+    try:
+        await db.applications.insert_one(app)
+    except DuplicateKeyError:
+        # Deux requêtes simultanées : l'index unique (shift_id, worker_id) tranche
+        raise HTTPException(status_code=400, detail="Vous avez déjà postulé à cette mission")
+    await record_application_created(db, current_user["id"])
+    admin_stats_cache.invalidate()
     return clean_mongo_doc(app)
 
+# Champs du shift utilisés par les listes et la modal de détails côté worker
+SHIFT_SUMMARY_PROJECTION = {
+    "_id": 0, "id": 1, "title": 1, "description": 1, "service_type": 1, "hotel_id": 1,
+    "hotel_name": 1, "hotel_city": 1, "dates": 1, "start_time": 1, "end_time": 1,
+    "hourly_rate": 1, "positions_available": 1, "status": 1
+}
+
 @api_router.get("/applications/worker")
-async def get_worker_applications(current_user: dict = Depends(get_current_user)):
+async def get_worker_applications(
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    limit: int = Query(100, ge=1, le=200),
+    after: Optional[str] = Query(None)
+):
     if current_user["role"] != UserRole.WORKER:
         raise HTTPException(status_code=403, detail="Accès réservé aux workers")
-    applications = await db.applications.find({"worker_id": current_user["id"]}).to_list(100)
-    # Enrichir avec les détails du shift
+    query = merge_filters({"worker_id": current_user["id"]}, keyset_filter(after))
+    applications = await db.applications.find(query).sort(KEYSET_SORT).to_list(limit + 1)
+    applications, next_cursor = split_page(applications, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    # Enrichir avec les détails du shift (une seule requête pour toute la page)
+    shift_ids = list({a["shift_id"] for a in applications if a.get("shift_id")})
+    shifts = await db.shifts.find({"id": {"$in": shift_ids}}, SHIFT_SUMMARY_PROJECTION).to_list(None) if shift_ids else []
+    shifts = {s["id"]: s for s in shifts}
     result = []
     for app in applications:
         app = clean_mongo_doc(app)
-        shift = await db.shifts.find_one({"id": app["shift_id"]})
-        if (shift):
-            shift = clean_mongo_doc(shift)
+        shift = shifts.get(app.get("shift_id"))
+        if shift:
             app["shift_title"] = shift.get("title")
             app["hotel_name"] = shift.get("hotel_name")
             app["shift_date"] = shift.get("dates", [""])[0] if shift.get("dates") else ""
             app["shift_start_time"] = shift.get("start_time")
             app["hourly_rate"] = shift.get("hourly_rate")
-            app["shift_details"] = shift # Détails complets pour la modal
+            app["shift_details"] = shift # Détails pour la modal
         result.append(app)
     return result
 
 @api_router.get("/applications/hotel")
-async def get_hotel_apps(current_user: dict = Depends(get_current_user)):
-    shifts = await db.shifts.find({"hotel_id": current_user["id"]}, {"id": 1}).to_list(100)
-    shift_ids = [s["id"] for s in shifts]
-    apps = await db.applications.find({"shift_id": {"$in": shift_ids}}).to_list(100)
-    # Enrichir avec les infos du worker
-    result = []
-    for app in apps:
-        app = clean_mongo_doc(app)
-        worker = await db.users.find_one({"id": app["worker_id"]})
-        if worker:
-            app["worker_first_name"] = worker.get("first_name")
-            app["worker_last_name"] = worker.get("last_name")
-            app["worker_phone"] = worker.get("phone")
-        result.append(app)
-    return result
+async def get_hotel_apps(
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    status: Optional[str] = Query(None),
+    shift_id: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=200),
+    after: Optional[str] = Query(None)
+):
+    inbox = await get_hotel_inbox(db, current_user["id"], status, shift_id, limit, after)
+    if inbox["total"] is not None:
+        response.headers["X-Total-Count"] = str(inbox["total"])
+    if inbox["next_cursor"]:
+        response.headers["X-Next-Cursor"] = inbox["next_cursor"]
+    return inbox["applications"]
+
+@api_router.get("/applications/hotel/inbox")
+async def get_hotel_apps_inbox(
+    current_user: dict = Depends(get_current_user),
+    status: Optional[str] = Query(None),
+    shift_id: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    after: Optional[str] = Query(None)
+):
+    if current_user["role"] != UserRole.HOTEL:
+        raise HTTPException(status_code=403, detail="Access denied")
+    return await get_hotel_inbox(db, current_user["id"], status, shift_id, limit, after)
 
 @api_router.put("/applications/{app_id}")
 async def update_app(app_id: str, payload: Dict[Any, Any], current_user: dict = Depends(get_current_user)):
@@ -493,72 +773,53 @@ async def update_app(app_id: str, payload: Dict[Any, Any], current_user: dict =
         raise HTTPException(status_code=404, detail="Mission non trouvée")
     if current_user["role"] != UserRole.ADMIN and shift["hotel_id"] != current_user["id"]:
         raise HTTPException(status_code=403, detail="Non autorisé")
-    await db.applications.update_one({"id": app_id}, {"$set": payload})
+    if "status" in payload:
+        # Transition conditionnelle : de deux appels concurrents, un seul applique les deltas des compteurs
+        previous = await db.applications.find_one_and_update(
+            {"id": app_id, "status": app.get("status")}, {"$set": payload}, return_document=ReturnDocument.BEFORE
+        )
+        if not previous:
+            current = await db.applications.find_one({"id": app_id}, {"status": 1})
+            if not current or current.get("status") != payload["status"]:
+                raise HTTPException(status_code=409, detail="Candidature modifiée entre-temps, veuillez réessayer")
+            # Double envoi : la transition a déjà été appliquée par l'autre appel
+            await db.applications.update_one({"id": app_id}, {"$set": payload})
+        else:
+            await record_status_change(db, app["worker_id"], previous.get("status"), payload["status"])
+            if await record_completion_change(db, app["worker_id"], previous.get("status"), payload["status"]):
+                await refresh_worker(app["worker_id"])
+    else:
+        await db.applications.update_one({"id": app_id}, {"$set": payload})
+    await sync_earning(db, {**app, **payload}, shift)
+    await sync_commission(db, {**app, **payload}, shift)
+    admin_stats_cache.invalidate()
     return {"status": "success"}
 
 # Worker earnings
 @api_router.get("/worker/earnings")
-async def get_worker_earnings(current_user: dict = Depends(get_current_user)):
+async def get_worker_earnings(
+    current_user: dict = Depends(get_current_user),
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    date_to: Optional[str] = Query(None, description="YYYY-MM-DD")
+):
     if current_user["role"] != UserRole.WORKER:
         raise HTTPException(status_code=403, detail="Accès réservé aux workers")
-
-    apps = await db.applications.find({
-        "worker_id": current_user["id"],
-        "status": {"$in": [ApplicationStatus.ACCEPTED, ApplicationStatus.COMPLETED]}
-    }).to_list(100)
-
-    total = 0
-    details = []
-    for app in apps:
-        shift = await db.shifts.find_one({"id": app["shift_id"]})
-        if shift:
-            # Calcul de la durée en heures
-            try:
-                start_time = shift.get("start_time", "00:00")
-                end_time = shift.get("end_time", "00:00")
-                start = datetime.strptime(start_time, "%H:%M")
-                end = datetime.strptime(end_time, "%H:%M")
-                # Si l'heure de fin est <= l'heure de début, on ajoute 1 jour (mission de nuit)
-                if end <= start:
-                    end = end.replace(day=end.day + 1)
-                duration = (end - start).total_seconds() / 3600  # en heures
-            except Exception as e:
-                logger.error(f"Erreur calcul durée pour shift {shift.get('id')}: {e}")
-                duration = 0
-
-            gain = shift.get("hourly_rate", 0) * duration
-            total += gain
-            details.append({
-                "shift_id": shift["id"],
-                "title": shift.get("title"),
-                "hotel_name": shift.get("hotel_name"),
-                "date": shift.get("dates", [""])[0] if shift.get("dates") else "",
-                "start_time": shift.get("start_time"),
-                "end_time": shift.get("end_time"),
-                "duration": round(duration, 2),
-                "hourly_rate": shift.get("hourly_rate"),
-                "earned": round(gain, 2),
-                "status": app["status"]
-            })
-    paid = sum(d["earned"] for d in details if d["status"] == ApplicationStatus.COMPLETED)
-    pending = sum(d["earned"] for d in details if d["status"] == ApplicationStatus.ACCEPTED)
-    return {"total_earnings": round(total, 2), "total": round(total, 2), "paid": round(paid, 2), "pending": round(pending, 2), "details": details}
+    return await get_worker_earnings_summary(db, current_user["id"], date_from, date_to)
 
 # Stats worker
 @api_router.get("/stats/worker")
 async def worker_stats(current_user: dict = Depends(get_current_user)):
     if current_user["role"] != UserRole.WORKER:
         raise HTTPException(status_code=403)
-    total_apps = await db.applications.count_documents({"worker_id": current_user["id"]})
-    accepted = await db.applications.count_documents({"worker_id": current_user["id"], "status": ApplicationStatus.ACCEPTED})
-    pending = await db.applications.count_documents({"worker_id": current_user["id"], "status": ApplicationStatus.PENDING})
-    rejected = await db.applications.count_documents({"worker_id": current_user["id"], "status": ApplicationStatus.REJECTED})
-    completed = await db.applications.count_documents({"worker_id": current_user["id"], "status": ApplicationStatus.COMPLETED})
+    counts = await get_worker_counters(db, current_user["id"])
+    total_apps = counts.get("total", 0)
+    accepted = counts.get("accepted", 0)
+    completed = counts.get("completed", 0)
     return {
         "total_applications": total_apps,
         "accepted": accepted,
-        "pending": pending,
-        "rejected": rejected,
+        "pending": counts.get("pending", 0),
+        "rejected": counts.get("rejected", 0),
         "completed": completed,
         "success_rate": round(((accepted + completed) / total_apps * 100) if total_apps > 0 else 0, 1)
     }
@@ -610,19 +871,22 @@ async def upload_worker_invoice(file: UploadFile = File(...), mission_id: str =
     """Permet à un worker de transmettre sa facture pour une mission"""
     if current_user["role"] != UserRole.WORKER:
         raise HTTPException(status_code=403, detail="Réservé aux workers")
+    invoice = {
+        "id": str(uuid.uuid4()),
+        "worker_id": current_user["id"],
+        "shift_id": mission_id,
+        "url": None,
+        "filename": file.filename,
+        "status": "submitted",
+        "upload_status": "pending",
+        "created_at": DateUtils.to_iso(DateUtils.now())
+    }
     try:
-        upload_result = cloudinary.uploader.upload(file.file, resource_type="raw")
-        url = upload_result.get("secure_url")
-        invoice = {
-            "id": str(uuid.uuid4()),
-            "worker_id": current_user["id"],
-            "shift_id": mission_id,
-            "url": url,
-            "filename": file.filename,
-            "status": "submitted",
-            "created_at": DateUtils.to_iso(DateUtils.now())
-        }
         await db.invoices.insert_one(invoice)
+        job = await upload_service.submit(db, current_user["id"], "invoice", file, [
+            ("invoices", {"id": invoice["id"]}, "url", "upload_status"),
+        ], resource_type="raw")
+        invoice["upload_id"] = job["id"]
         return clean_mongo_doc(invoice)
     except Exception as e:
         logger.error(f"Failed to upload worker invoice: {e}")
@@ -631,15 +895,31 @@ async def upload_worker_invoice(file: UploadFile = File(...), mission_id: str =
 @api_router.post("/worker/avatar")
 @api_router.post("/hotel/avatar")
 async def upload_avatar(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
-    result = cloudinary.uploader.upload(file.file)
-    url = result.get("secure_url")
-    await db.users.update_one({"id": current_user["id"]}, {"$set": {"avatar_url": url}})
-    return {"avatar_url": url}
+    # URL connue seulement à la fin du transfert : le client suit /uploads/{upload_id} avant de changer l'image
+    job = await upload_service.submit(db, current_user["id"], "avatar", file, [
+        ("users", {"id": current_user["id"]}, "avatar_url", None),
+    ], on_complete=lambda: user_cache.invalidate(current_user["id"]))
+    return {"avatar_url": None, "upload_id": job["id"], "upload_status": job["status"]}
+
+@api_router.get("/uploads/{upload_id}")
+async def get_upload_status(upload_id: str, current_user: dict = Depends(get_current_user)):
+    job = await db.uploads.find_one({"id": upload_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if current_user.get("role") != "admin" and job.get("user_id") != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    return job
 
 @api_router.put("/hotels/me")
 async def update_hotel_profile(payload: Dict[Any, Any], current_user: dict = Depends(get_current_user)):
     if current_user["role"] != UserRole.HOTEL: raise HTTPException(status_code=403)
+    payload = user_writable(payload)
+    if not payload:
+        return {"status": "success"}
     await db.users.update_one({"id": current_user["id"]}, {"$set": payload})
+    await refresh_search_keys(db, "users", {"id": current_user["id"]}, payload.keys())
+    await refresh_location(db, "users", {"id": current_user["id"]}, payload.keys())
+    user_cache.invalidate(current_user["id"])
     return {"status": "success"}
 
 @api_router.get("/hotels/settings")
@@ -653,238 +933,156 @@ async def update_hotel_settings(payload: Dict[Any, Any], current_user: dict = De
     await db.hotel_settings.update_one({"hotel_id": current_user["id"]}, {"$set": payload}, upsert=True)
     return {"status": "success"}
 
-# Support (routes communes + routes spécifiques worker/hotel)
+# Support (routes communes + routes spécifiques worker/hotel, toutes adossées à services/support)
+async def publish_support_event(thread_id: str, event: Dict) -> None:
+    """Pousse l'événement aux abonnés de la conversation et à la boîte de réception admin"""
+    await support_broker.publish(thread_topic(thread_id), event)
+    await support_broker.publish(ADMIN_INBOX, event)
+
+async def publish_thread_update(thread_id: str) -> None:
+    thread = await db.support_threads.find_one({"id": thread_id}, {"_id": 0, **{f: 1 for f in THREAD_EVENT_FIELDS}})
+    if thread:
+        await publish_support_event(thread_id, {"type": "thread", "thread": thread})
+
+async def publish_message(message: Dict) -> None:
+    await publish_support_event(message["thread_id"], {"type": "message", "thread_id": message["thread_id"], "message": clean_mongo_doc(message)})
+
+async def thread_access_error(thread_id: str, owner_only: bool = False) -> HTTPException:
+    """404 sur les routes worker/hotel ; 403 sur les routes communes si la conversation existe"""
+    if not owner_only and await db.support_threads.find_one({"id": thread_id}, {"_id": 1}):
+        return HTTPException(status_code=403, detail="Access denied")
+    return HTTPException(status_code=404, detail="Thread not found")
+
+async def get_support_thread(thread_id: str, current_user: dict, owner_only: bool = False) -> Dict:
+    thread = await db.support_threads.find_one(thread_filter(thread_id, current_user, owner_only), {"user_id": 1})
+    if not thread:
+        raise await thread_access_error(thread_id, owner_only)
+    return thread
+
+async def read_support_messages(thread_id: str, current_user: dict, response: Response, since: Optional[str],
+                                before: Optional[str], limit: int, owner_only: bool = False) -> List[Dict]:
+    thread = await get_support_thread(thread_id, current_user, owner_only)
+    if thread.get("user_id") != current_user["id"]:
+        messages, headers = await get_messages_page(db, thread_id, since, before, limit)
+    else:
+        # Le propriétaire lit la conversation : ses non-lus retombent à zéro
+        (messages, headers), was_unread = await asyncio.gather(
+            get_messages_page(db, thread_id, since, before, limit), mark_read(db, thread_id, "user")
+        )
+        if was_unread:
+            await publish_thread_update(thread_id)
+    response.headers.update(headers)
+    return [clean_mongo_doc(m) for m in messages]
+
+async def post_support_message(thread_id: str, payload: Dict, current_user: dict, owner_only: bool = False) -> Dict:
+    message, thread = await post_message(db, thread_id, current_user, payload.get("body", ""), owner_only)
+    if not message:
+        raise await thread_access_error(thread_id, owner_only)
+    await publish_message(message)
+    await publish_support_event(thread_id, {"type": "thread", "thread": clean_mongo_doc(thread)})
+    return clean_mongo_doc(message)
+
+async def open_support_thread(payload: Dict, current_user: dict, role: Optional[str] = None) -> Dict:
+    thread, _ = await create_thread(db, current_user, payload.get("subject"), payload.get("message"), role)
+    admin_stats_cache.invalidate()
+    await publish_support_event(thread["id"], {"type": "thread", "thread": clean_mongo_doc(thread)})
+    return clean_mongo_doc(thread)
+
+@api_router.post("/support/stream-ticket")
+async def create_support_stream_ticket(current_user: dict = Depends(get_current_user)):
+    """Vérifié à l'ouverture du flux seulement : en redemander un avant chaque (re)connexion EventSource"""
+    return {"ticket": create_stream_ticket(current_user["id"]), "expires_in": STREAM_TICKET_SECONDS}
+
+@api_router.get("/support/threads/{thread_id}/events")
+async def thread_events(thread_id: str, current_user: dict = Depends(get_stream_user)):
+    """Flux SSE d'une conversation : nouveaux messages et changements de statut uniquement"""
+    await get_support_thread(thread_id, current_user)
+    return StreamingResponse(support_broker.stream(thread_topic(thread_id)), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@api_router.get("/admin/support/events")
+async def admin_support_events(current_user: dict = Depends(get_stream_user)):
+    """Flux SSE de la boîte de réception admin (toutes les conversations)"""
+    if current_user.get("role") != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return StreamingResponse(support_broker.stream(ADMIN_INBOX), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@api_router.get("/support/unread")
+async def get_support_unread(current_user: dict = Depends(get_current_user)):
+    """Pastille de messagerie : non-lus de l'utilisateur, ou de toute la boîte de réception pour un admin"""
+    return await unread_counts(db, current_user)
+
 @api_router.get("/support/threads")
 @api_router.get("/support/threads/me")
-async def get_threads(current_user: dict = Depends(get_current_user)):
-    threads = await db.support_threads.find({"user_id": current_user["id"]}).sort("created_at", -1).to_list(100)
-    return [clean_mongo_doc(t) for t in threads]
-
 @api_router.get("/worker/support/threads")
-async def get_worker_threads(current_user: dict = Depends(get_current_user)):
-    threads = await db.support_threads.find({"user_id": current_user["id"]}).sort("created_at", -1).to_list(100)
-    return [clean_mongo_doc(t) for t in threads]
-
 @api_router.get("/hotel/support/threads")
-async def get_hotel_threads(current_user: dict = Depends(get_current_user)):
+async def get_threads(current_user: dict = Depends(get_current_user)):
     threads = await db.support_threads.find({"user_id": current_user["id"]}).sort("created_at", -1).to_list(100)
     return [clean_mongo_doc(t) for t in threads]
 
 @api_router.get("/support/threads/{thread_id}")
-async def get_thread_messages(thread_id: str, current_user: dict = Depends(get_current_user)):
-    thread = await db.support_threads.find_one({"id": thread_id})
-    if not thread:
-        raise HTTPException(status_code=404, detail="Thread not found")
-    # Vérifier que l'utilisateur a accès (propriétaire ou admin)
-    if current_user.get("role") != "admin" and thread.get("user_id") != current_user["id"]:
-        raise HTTPException(status_code=403, detail="Access denied")
-    messages = await db.support_messages.find({"thread_id": thread_id}).sort("created_at", 1).to_list(500)
-    return [clean_mongo_doc(m) for m in messages]
+async def get_thread_messages(
+    thread_id: str,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    since: Optional[str] = Query(None, description="X-Since-Cursor reçu : seulement les nouveaux messages"),
+    before: Optional[str] = Query(None, description="X-Before-Cursor reçu : la page de messages plus anciens"),
+    limit: int = Query(500, ge=1, le=500)
+):
+    # Propriétaire ou admin
+    return await read_support_messages(thread_id, current_user, response, since, before, limit)
 
 @api_router.get("/worker/support/threads/{thread_id}")
-async def get_worker_thread_messages(thread_id: str, current_user: dict = Depends(get_current_user)):
-    thread = await db.support_threads.find_one({"id": thread_id, "user_id": current_user["id"]})
-    if not thread:
-        raise HTTPException(status_code=404, detail="Thread not found")
-    messages = await db.support_messages.find({"thread_id": thread_id}).sort("created_at", 1).to_list(500)
-    return [clean_mongo_doc(m) for m in messages]
+async def get_worker_thread_messages(
+    thread_id: str,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    since: Optional[str] = Query(None, description="X-Since-Cursor reçu : seulement les nouveaux messages"),
+    before: Optional[str] = Query(None, description="X-Before-Cursor reçu : la page de messages plus anciens"),
+    limit: int = Query(500, ge=1, le=500)
+):
+    return await read_support_messages(thread_id, current_user, response, since, before, limit, owner_only=True)
 
 @api_router.get("/hotel/support/threads/{thread_id}")
-async def get_hotel_thread_messages(thread_id: str, current_user: dict = Depends(get_current_user)):
-    thread = await db.support_threads.find_one({"id": thread_id, "user_id": current_user["id"]})
-    if not thread:
-        raise HTTPException(status_code=404, detail="Thread not found")
-    messages = await db.support_messages.find({"thread_id": thread_id}).sort("created_at", 1).to_list(500)
-    return [clean_mongo_doc(m) for m in messages]
+async def get_hotel_thread_messages(
+    thread_id: str,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    since: Optional[str] = Query(None, description="X-Since-Cursor reçu : seulement les nouveaux messages"),
+    before: Optional[str] = Query(None, description="X-Before-Cursor reçu : la page de messages plus anciens"),
+    limit: int = Query(500, ge=1, le=500)
+):
+    return await read_support_messages(thread_id, current_user, response, since, before, limit, owner_only=True)
 
 @api_router.post("/support/threads/{thread_id}/messages")
 async def post_thread_message(thread_id: str, payload: Dict[Any, Any], current_user: dict = Depends(get_current_user)):
-    thread = await db.support_threads.find_one({"id": thread_id})
-    if not thread:
-        raise HTTPException(status_code=404, detail="Thread not found")
-    if current_user.get("role") != "admin" and thread.get("user_id") != current_user["id"]:
-        raise HTTPException(status_code=403, detail="Access denied")
-    is_admin = current_user.get("role") == "admin"
-    message = {
-        "id": str(uuid.uuid4()),
-        "thread_id": thread_id,
-        "sender_id": current_user["id"],
-        "sender_email": current_user.get("email"),
-        "sender_role": current_user.get("role"),
-        "body": payload.get("body", ""),
-        "is_admin": is_admin,
-        "created_at": DateUtils.to_iso(DateUtils.now())
-    }
-    await db.support_messages.insert_one(message)
-    # Mettre à jour le thread avec le dernier message
-    await db.support_threads.update_one(
-        {"id": thread_id},
-        {"$set": {
-            "last_message": payload.get("body", "")[:100],
-            "last_message_at": DateUtils.to_iso(DateUtils.now()),
-            "last_sender_role": current_user.get("role"),
-            "status": "in_progress" if not is_admin else thread.get("status", "open")
-        }}
-    )
-    return clean_mongo_doc(message)
+    return await post_support_message(thread_id, payload, current_user)
 
 @api_router.post("/worker/support/threads/{thread_id}/messages")
 async def post_worker_thread_message(thread_id: str, payload: Dict[Any, Any], current_user: dict = Depends(get_current_user)):
-    thread = await db.support_threads.find_one({"id": thread_id, "user_id": current_user["id"]})
-    if not thread:
-        raise HTTPException(status_code=404, detail="Thread not found")
-    message = {
-        "id": str(uuid.uuid4()),
-        "thread_id": thread_id,
-        "sender_id": current_user["id"],
-        "sender_email": current_user.get("email"),
-        "sender_role": current_user.get("role"),
-        "body": payload.get("body", ""),
-        "is_admin": False,
-        "created_at": DateUtils.to_iso(DateUtils.now())
-    }
-    await db.support_messages.insert_one(message)
-    await db.support_threads.update_one(
-        {"id": thread_id},
-        {"$set": {
-            "last_message": payload.get("body", "")[:100],
-            "last_message_at": DateUtils.to_iso(DateUtils.now()),
-            "last_sender_role": "worker"
-        }}
-    )
-    return clean_mongo_doc(message)
+    return await post_support_message(thread_id, payload, current_user, owner_only=True)
 
 @api_router.post("/hotel/support/threads/{thread_id}/messages")
 async def post_hotel_thread_message(thread_id: str, payload: Dict[Any, Any], current_user: dict = Depends(get_current_user)):
-    thread = await db.support_threads.find_one({"id": thread_id, "user_id": current_user["id"]})
-    if not thread:
-        raise HTTPException(status_code=404, detail="Thread not found")
-    message = {
-        "id": str(uuid.uuid4()),
-        "thread_id": thread_id,
-        "sender_id": current_user["id"],
-        "sender_email": current_user.get("email"),
-        "sender_role": current_user.get("role"),
-        "body": payload.get("body", ""),
-        "is_admin": False,
-        "created_at": DateUtils.to_iso(DateUtils.now())
-    }
-    await db.support_messages.insert_one(message)
-    await db.support_threads.update_one(
-        {"id": thread_id},
-        {"$set": {
-            "last_message": payload.get("body", "")[:100],
-            "last_message_at": DateUtils.to_iso(DateUtils.now()),
-            "last_sender_role": "hotel"
-        }}
-    )
-    return clean_mongo_doc(message)
+    return await post_support_message(thread_id, payload, current_user, owner_only=True)
 
 @api_router.post("/support/threads")
 async def create_support_thread(payload: Dict[Any, Any], current_user: dict = Depends(get_current_user)):
-    thread_id = str(uuid.uuid4())
-    thread = {
-        "id": thread_id,
-        "user_id": current_user["id"],
-        "user_email": current_user["email"],
-        "user_role": current_user.get("role"),
-        "subject": payload.get("subject"),
-        "status": "open",
-        "created_at": DateUtils.to_iso(DateUtils.now())
-    }
-    await db.support_threads.insert_one(thread)
-    # Créer le premier message
-    if payload.get("message"):
-        first_message = {
-            "id": str(uuid.uuid4()),
-            "thread_id": thread_id,
-            "sender_id": current_user["id"],
-            "sender_email": current_user.get("email"),
-            "sender_role": current_user.get("role"),
-            "body": payload.get("message"),
-            "is_admin": False,
-            "created_at": DateUtils.to_iso(DateUtils.now())
-        }
-        await db.support_messages.insert_one(first_message)
-        thread["last_message"] = payload.get("message", "")[:100]
-        thread["last_message_at"] = DateUtils.to_iso(DateUtils.now())
-    return clean_mongo_doc(thread)
+    return await open_support_thread(payload, current_user)
 
 @api_router.post("/worker/support/threads")
 async def create_worker_support_thread(payload: Dict[Any, Any], current_user: dict = Depends(get_current_user)):
-    thread_id = str(uuid.uuid4())
-    thread = {
-        "id": thread_id,
-        "user_id": current_user["id"],
-        "user_email": current_user["email"],
-        "user_role": "worker",
-        "subject": payload.get("subject"),
-        "status": "open",
-        "created_at": DateUtils.to_iso(DateUtils.now())
-    }
-    await db.support_threads.insert_one(thread)
-    if payload.get("message"):
-        first_message = {
-            "id": str(uuid.uuid4()),
-            "thread_id": thread_id,
-            "sender_id": current_user["id"],
-            "sender_email": current_user.get("email"),
-            "sender_role": "worker",
-            "body": payload.get("message"),
-            "is_admin": False,
-            "created_at": DateUtils.to_iso(DateUtils.now())
-        }
-        await db.support_messages.insert_one(first_message)
-    return clean_mongo_doc(thread)
+    return await open_support_thread(payload, current_user, role="worker")
 
 @api_router.post("/hotel/support/threads")
 async def create_hotel_support_thread(payload: Dict[Any, Any], current_user: dict = Depends(get_current_user)):
-    thread_id = str(uuid.uuid4())
-    thread = {
-        "id": thread_id,
-        "user_id": current_user["id"],
-        "user_email": current_user["email"],
-        "user_role": "hotel",
-        "subject": payload.get("subject"),
-        "status": "open",
-        "created_at": DateUtils.to_iso(DateUtils.now())
-    }
-    await db.support_threads.insert_one(thread)
-    if payload.get("message"):
-        first_message = {
-            "id": str(uuid.uuid4()),
-            "thread_id": thread_id,
-            "sender_id": current_user["id"],
-            "sender_email": current_user.get("email"),
-            "sender_role": "hotel",
-            "body": payload.get("message"),
-            "is_admin": False,
-            "created_at": DateUtils.to_iso(DateUtils.now())
-        }
-        await db.support_messages.insert_one(first_message)
-    return clean_mongo_doc(thread)
+    return await open_support_thread(payload, current_user, role="hotel")
 
 # Admin
 @api_router.get("/admin/stats")
-async def admin_stats(current_user: dict = Depends(require_admin)):
-    pending_workers = await db.users.count_documents({"role": "worker", "verification_status": "pending"})
-    pending_hotels = await db.users.count_documents({"role": "hotel", "verification_status": "unverified"})
-    return {
-        "total_users": await db.users.count_documents({}),
-        "total_workers": await db.users.count_documents({"role": "worker"}),
-        "total_hotels": await db.users.count_documents({"role": "hotel"}),
-        "pending_workers": pending_workers,
-        "pending_hotels": pending_hotels,
-        "pending_verifications": pending_workers + pending_hotels,
-        "total_shifts": await db.shifts.count_documents({}),
-        "revenue": 0,
-        "open_support_threads": await db.support_threads.count_documents({"status": "open"}),
-        "open_disputes": await db.disputes.count_documents({"status": "open"}),
-        "pending_reviews": await db.ratings.count_documents({"verified": {"$ne": True}}),
-        "shifts_today": await db.shifts.count_documents({"created_at": {"$gte": DateUtils.to_iso(datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0))}}),
-        "active_users_7d": 0,
-        "applications_today": await db.applications.count_documents({"created_at": {"$gte": DateUtils.to_iso(datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0))}})
-    }
+async def admin_stats(current_user: dict = Depends(require_admin), refresh: bool = Query(False)):
+    return await admin_stats_cache.get(db, force=refresh)
 
 @api_router.get("/admin/users")
 async def admin_users(
@@ -893,29 +1091,37 @@ async def admin_users(
     limit: int = Query(20, ge=1, le=100),
     role: Optional[str] = Query(None),
     verification: Optional[str] = Query(None),
-    search: Optional[str] = Query(None)
+    search: Optional[str] = Query(None),
+    after: Optional[str] = Query(None, description="Curseur opaque (vide pour la 1re page) : active la pagination par curseur"),
+    with_total: bool = Query(True)
 ):
     query = {}
     if role:
         query["role"] = role
     if verification:
         query["verification_status"] = verification
-    if search:
-        query["$or"] = [
-            {"email": {"$regex": search, "$options": "i"}},
-            {"first_name": {"$regex": search, "$options": "i"}},
-            {"last_name": {"$regex": search, "$options": "i"}},
-            {"hotel_name": {"$regex": search, "$options": "i"}},
-        ]
-    total = await db.users.count_documents(query)
-    skip = (page - 1) * limit
-    users = await db.users.find(query, {"password_hash": 0}).skip(skip).limit(limit).to_list(limit)
+    terms = search_terms(search)
+    query.update(search_filter(terms))
     def enrich_user(u):
         u = clean_mongo_doc(u)
         fn = u.get("first_name", "") or ""
         ln = u.get("last_name", "") or ""
         u["name"] = f"{fn} {ln}".strip() or u.get("email", "")
         return u
+    if after is not None:
+        users, next_cursor = await keyset_page(db.users, query, limit, after or None, {"password_hash": 0})
+        return {
+            "users": [enrich_user(u) for u in users],
+            "next_cursor": next_cursor,
+            "limit": limit,
+            "total": await count_cache.count(db.users, query) if with_total else None
+        }
+    total = await count_cache.count(db.users, query)
+    skip = (page - 1) * limit
+    if terms:
+        users = await db.users.aggregate(ranked_search_pipeline(query, terms, {"created_at": -1}, skip, limit, {"password_hash": 0})).to_list(limit)
+    else:
+        users = await db.users.find(query, {"password_hash": 0}).skip(skip).limit(limit).to_list(limit)
     return {
         "users": [enrich_user(u) for u in users],
         "total": total,
@@ -924,18 +1130,30 @@ async def admin_users(
         "pages": max(1, (total + limit - 1) // limit)
     }
 
+USER_EXPORT_COLUMNS = [(name, field(name)) for name in ["id", "email", "role", "first_name", "last_name", "hotel_name", "verification_status", "created_at"]]
+
 @api_router.get("/admin/users/export")
-async def export_users(current_user: dict = Depends(require_admin)):
-    from fastapi.responses import StreamingResponse
-    import io, csv
-    users = await db.users.find({}, {"password_hash": 0}).to_list(None)
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["id", "email", "role", "first_name", "last_name", "hotel_name", "verification_status", "created_at"])
-    for u in users:
-        writer.writerow([u.get("id",""), u.get("email",""), u.get("role",""), u.get("first_name",""), u.get("last_name",""), u.get("hotel_name",""), u.get("verification_status",""), u.get("created_at","")])
-    output.seek(0)
-    return StreamingResponse(iter([output.getvalue()]), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=utilisateurs.csv"})
+async def export_users(
+    current_user: dict = Depends(require_admin),
+    role: Optional[str] = Query(None),
+    verification: Optional[str] = Query(None),
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    date_to: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    gzip: bool = Query(False)
+):
+    query = date_range_filter(date_from, date_to)
+    if role:
+        query["role"] = role
+    if verification:
+        query["verification_status"] = verification
+    projection = {"_id": 0, **{name: 1 for name, _ in USER_EXPORT_COLUMNS}}
+    cursor = db.users.find(query, projection).sort("created_at", -1)
+    filename = "utilisateurs.csv.gz" if gzip else "utilisateurs.csv"
+    return StreamingResponse(
+        stream_csv(cursor, USER_EXPORT_COLUMNS, compress=gzip),
+        media_type="application/gzip" if gzip else "text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
 
 @api_router.get("/admin/users/{user_id}")
 async def admin_get_user(user_id: str, current_user: dict = Depends(require_admin)):
@@ -1004,18 +1222,11 @@ async def verify_user(user_id: str, payload: Dict[Any, Any], current_user: dict
     if status == "rejected" and reason:
         update_data["rejection_reason"] = reason
     await db.users.update_one({"id": user_id}, {"$set": update_data})
+    await worker_index.refresh(db, user_id)
+    user_cache.invalidate(user_id)
+    admin_stats_cache.invalidate()
     # Audit log
-    await db.audit_logs.insert_one({
-        "id": str(uuid.uuid4()),
-        "admin_id": current_user["id"],
-        "admin_email": current_user.get("email"),
-        "action": f"user_{status}",
-        "target_type": "user",
-        "target_id": user_id,
-        "target_email": user.get("email"),
-        "details": {"reason": reason},
-        "created_at": DateUtils.to_iso(DateUtils.now())
-    })
+    await audit_log.record(current_user, f"user_{status}", "user", user_id, target_email=user.get("email"), details={"reason": reason})
     return {"status": "success", "message": f"User {status}"}
 
 @api_router.put("/admin/users/{user_id}/suspend")
@@ -1031,6 +1242,8 @@ async def suspend_user(user_id: str, payload: Dict[Any, Any], current_user: dict
         if duration_days and duration_days > 0:
             suspended_until = DateUtils.to_iso(DateUtils.now() + timedelta(days=duration_days))
         await db.users.update_one({"id": user_id}, {"$set": {"is_suspended": True, "suspended_until": suspended_until, "suspension_reason": reason}})
+        worker_index.remove(user_id)
+        user_cache.invalidate(user_id)
         await db.suspensions.insert_one({
             "id": str(uuid.uuid4()),
             "user_id": user_id,
@@ -1044,30 +1257,12 @@ async def suspend_user(user_id: str, payload: Dict[Any, Any], current_user: dict
             "status": "active",
             "suspended_at": DateUtils.to_iso(DateUtils.now())
         })
-        await db.audit_logs.insert_one({
-            "id": str(uuid.uuid4()),
-            "admin_id": current_user["id"],
-            "admin_email": current_user.get("email"),
-            "action": "user_suspended",
-            "target_type": "user",
-            "target_id": user_id,
-            "target_email": user.get("email"),
-            "details": {"reason": reason, "duration_days": duration_days},
-            "created_at": DateUtils.to_iso(DateUtils.now())
-        })
+        await audit_log.record(current_user, "user_suspended", "user", user_id, target_email=user.get("email"), details={"reason": reason, "duration_days": duration_days})
     else:
         await db.users.update_one({"id": user_id}, {"$set": {"is_suspended": False, "suspended_until": None, "suspension_reason": None}})
-        await db.audit_logs.insert_one({
-            "id": str(uuid.uuid4()),
-            "admin_id": current_user["id"],
-            "admin_email": current_user.get("email"),
-            "action": "user_unbanned",
-            "target_type": "user",
-            "target_id": user_id,
-            "target_email": user.get("email"),
-            "details": {},
-            "created_at": DateUtils.to_iso(DateUtils.now())
-        })
+        await worker_index.refresh(db, user_id)
+        user_cache.invalidate(user_id)
+        await audit_log.record(current_user, "user_unbanned", "user", user_id, target_email=user.get("email"))
     return {"status": "success"}
 
 @api_router.post("/admin/users/{user_id}/reset-password")
@@ -1079,19 +1274,10 @@ async def admin_reset_password(user_id: str, payload: Dict[Any, Any], current_us
     if not new_password:
         # Générer un mot de passe aléatoire
         new_password = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(12))
-    password_hash = bcrypt.hashpw(new_password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    password_hash = await password_hasher.hash(new_password)
     await db.users.update_one({"id": user_id}, {"$set": {"password_hash": password_hash}})
-    await db.audit_logs.insert_one({
-        "id": str(uuid.uuid4()),
-        "admin_id": current_user["id"],
-        "admin_email": current_user.get("email"),
-        "action": "password_reset_admin",
-        "target_type": "user",
-        "target_id": user_id,
-        "target_email": user.get("email"),
-        "details": {},
-        "created_at": DateUtils.to_iso(DateUtils.now())
-    })
+    user_cache.invalidate(user_id)
+    await audit_log.record(current_user, "password_reset_admin", "user", user_id, target_email=user.get("email"))
     return {"status": "success", "new_password": new_password}
 
 @api_router.put("/admin/documents/{doc_id}/status")
@@ -1107,33 +1293,28 @@ async def admin_update_document_status(doc_id: str, payload: Dict[Any, Any], cur
         raise HTTPException(status_code=400, detail="Status must be verified, rejected or pending")
     reason = payload.get("reason", "")
     await db.documents.update_one({"id": doc_id}, {"$set": {"status": new_status, "rejection_reason": reason, "reviewed_at": DateUtils.to_iso(DateUtils.now()), "reviewed_by": current_user["id"]}})
-    await db.audit_logs.insert_one({
-        "id": str(uuid.uuid4()),
-        "admin_id": current_user["id"],
-        "admin_email": current_user.get("email"),
-        "action": f"document_{new_status}",
-        "target_type": "document",
-        "target_id": doc_id,
-        "target_email": doc.get("user_id"),
-        "details": {"reason": reason, "doc_type": doc.get("type")},
-        "created_at": DateUtils.to_iso(DateUtils.now())
-    })
+    await audit_log.record(current_user, f"document_{new_status}", "document", doc_id, target_email=doc.get("user_id"), details={"reason": reason, "doc_type": doc.get("type")})
     return {"status": "success"}
 @api_router.get("/admin/support/threads")
 async def admin_threads(
+    response: Response,
     current_user: dict = Depends(require_admin),
     q: Optional[str] = Query(None),
-    status: Optional[str] = Query(None)
+    status: Optional[str] = Query(None),
+    limit: int = Query(200, ge=1, le=200),
+    after: Optional[str] = Query(None)
 ):
     query = {}
     if status:
         query["status"] = status
-    if q:
-        query["$or"] = [
-            {"subject": {"$regex": q, "$options": "i"}},
-            {"user_email": {"$regex": q, "$options": "i"}},
-        ]
-    threads = await db.support_threads.find(query).sort("created_at", -1).to_list(200)
+    terms = search_terms(q)
+    query.update(search_filter(terms))
+    if terms:
+        threads = await db.support_threads.aggregate(ranked_search_pipeline(query, terms, {"created_at": -1}, 0, limit)).to_list(limit)
+    else:
+        threads, next_cursor = await keyset_page(db.support_threads, query, limit, after)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
     return [clean_mongo_doc(t) for t in threads]
 
 @api_router.put("/admin/support/threads/{thread_id}")
@@ -1144,8 +1325,11 @@ async def admin_update_thread(thread_id: str, payload: Dict[Any, Any], current_u
     if payload.get("mark_admin_read"):
         update["admin_read"] = True
         update["admin_read_at"] = DateUtils.to_iso(DateUtils.now())
+        update["unread_by_admin"] = 0
     if update:
         await db.support_threads.update_one({"id": thread_id}, {"$set": update})
+        admin_stats_cache.invalidate()
+        await publish_thread_update(thread_id)
     return {"status": "success"}
 
 @api_router.get("/admin/shifts")
@@ -1154,19 +1338,25 @@ async def admin_shifts(
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
     status: Optional[str] = Query(None),
-    search: Optional[str] = Query(None)
+    search: Optional[str] = Query(None),
+    after: Optional[str] = Query(None, description="Curseur opaque (vide pour la 1re page) : active la pagination par curseur"),
+    with_total: bool = Query(True)
 ):
     query = {}
     if status:
         query["status"] = status
-    if search:
-        query["$or"] = [
-            {"title": {"$regex": search, "$options": "i"}},
-            {"hotel_name": {"$regex": search, "$options": "i"}},
-        ]
-    total = await db.shifts.count_documents(query)
-    skip = (page - 1) * limit
-    shifts = await db.shifts.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    terms = search_terms(search)
+    query.update(search_filter(terms))
+    next_cursor = None
+    if after is not None:
+        shifts, next_cursor = await keyset_page(db.shifts, query, limit, after or None)
+    else:
+        total = await count_cache.count(db.shifts, query)
+        skip = (page - 1) * limit
+        if terms:
+            shifts = await db.shifts.aggregate(ranked_search_pipeline(query, terms, {"created_at": -1}, skip, limit)).to_list(limit)
+        else:
+            shifts = await db.shifts.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
     result = []
     for shift in shifts:
         shift = clean_mongo_doc(shift)
@@ -1174,6 +1364,13 @@ async def admin_shifts(
         apps = await db.applications.find({"shift_id": shift["id"]}).to_list(100)
         shift["applications"] = [clean_mongo_doc(a) for a in apps]
         result.append(shift)
+    if after is not None:
+        return {
+            "shifts": result,
+            "next_cursor": next_cursor,
+            "limit": limit,
+            "total": await count_cache.count(db.shifts, query) if with_total else None
+        }
     return {
         "shifts": result,
         "total": total,
@@ -1190,7 +1387,20 @@ async def admin_assign_shift(shift_id: str, payload: Dict[Any, Any], current_use
     # Trouver ou créer une candidature
     existing = await db.applications.find_one({"shift_id": shift_id, "worker_id": worker_id})
     if existing:
-        await db.applications.update_one({"shift_id": shift_id, "worker_id": worker_id}, {"$set": {"status": "accepted"}})
+        app = {**existing, "status": "accepted"}
+        # Conditionnel sur le statut lu : un double envoi n'applique les deltas qu'une fois
+        previous = await db.applications.find_one_and_update(
+            {"id": existing["id"], "status": existing.get("status")}, {"$set": {"status": "accepted"}},
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous:
+            await record_status_change(db, worker_id, previous.get("status"), "accepted")
+            if await record_completion_change(db, worker_id, previous.get("status"), "accepted"):
+                await refresh_worker(worker_id)
+        else:
+            current = await db.applications.find_one({"id": existing["id"]}, {"status": 1})
+            if not current or current.get("status") != "accepted":
+                raise HTTPException(status_code=409, detail="Candidature modifiée entre-temps, veuillez réessayer")
     else:
         worker = await db.users.find_one({"id": worker_id})
         if not worker:
@@ -1206,7 +1416,12 @@ async def admin_assign_shift(shift_id: str, payload: Dict[Any, Any], current_use
             "assigned_by_admin": True
         }
         await db.applications.insert_one(app)
+        await record_application_created(db, worker_id, "accepted")
     await db.shifts.update_one({"id": shift_id}, {"$set": {"status": "filled"}})
+    shift_feed_cache.invalidate()
+    await sync_earning(db, app)
+    await sync_commission(db, app)
+    admin_stats_cache.invalidate()
     return {"status": "success"}
 
 @api_router.get("/admin/audit")
@@ -1216,21 +1431,32 @@ async def admin_audit(
     limit: int = Query(50, ge=1, le=200),
     action: Optional[str] = Query(None),
     target_type: Optional[str] = Query(None),
-    search: Optional[str] = Query(None)
+    search: Optional[str] = Query(None),
+    after: Optional[str] = Query(None, description="Curseur opaque (vide pour la 1re page) : active la pagination par curseur"),
+    with_total: bool = Query(True)
 ):
+    await audit_log.flush()
     query = {}
     if action:
         query["action"] = action
     if target_type:
         query["target_type"] = target_type
-    if search:
-        query["$or"] = [
-            {"admin_email": {"$regex": search, "$options": "i"}},
-            {"target_email": {"$regex": search, "$options": "i"}},
-        ]
-    total = await db.audit_logs.count_documents(query)
+    terms = search_terms(search)
+    query.update(search_filter(terms))
+    if after is not None:
+        logs, next_cursor = await keyset_page(db.audit_logs, query, limit, after or None)
+        return {
+            "logs": [clean_mongo_doc(l) for l in logs],
+            "next_cursor": next_cursor,
+            "limit": limit,
+            "total": await count_cache.count(db.audit_logs, query) if with_total else None
+        }
+    total = await count_cache.count(db.audit_logs, query)
     skip = (page - 1) * limit
-    logs = await db.audit_logs.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    if terms:
+        logs = await db.audit_logs.aggregate(ranked_search_pipeline(query, terms, {"created_at": -1}, skip, limit)).to_list(limit)
+    else:
+        logs = await db.audit_logs.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
     return {
         "logs": [clean_mongo_doc(l) for l in logs],
         "total": total,
@@ -1238,46 +1464,59 @@ async def admin_audit(
         "limit": limit,
          "pages": max(1, (total + limit - 1) // limit)
     }
+AUDIT_EXPORT_COLUMNS = [
+    *[(name, field(name)) for name in ["id", "admin_email", "action", "target_type", "target_email", "created_at"]],
+    ("details", lambda log: str(log.get("details", ""))),
+]
+
 @api_router.get("/admin/audit/export")
-async def admin_audit_export(current_user: dict = Depends(require_admin)):
-    """Exporte tous les logs d'audit en CSV"""
-    from fastapi.responses import StreamingResponse
-    import io
-    import csv
-    logs = await db.audit_logs.find({}).sort("created_at", -1).to_list(None)
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=["id", "admin_email", "action", "target_type", "target_email", "created_at", "details"])
-    writer.writeheader()
-    for log in logs:
-        log = clean_mongo_doc(log)
-        writer.writerow({
-            "id": log.get("id", ""),
-            "admin_email": log.get("admin_email", ""),
-            "action": log.get("action", ""),
-            "target_type": log.get("target_type", ""),
-            "target_email": log.get("target_email", ""),
-            "created_at": log.get("created_at", ""),
-            "details": str(log.get("details", ""))
-        })
-    output.seek(0)
+async def admin_audit_export(
+    current_user: dict = Depends(require_admin),
+    action: Optional[str] = Query(None),
+    target_type: Optional[str] = Query(None),
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    date_to: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    gzip: bool = Query(False)
+):
+    """Exporte les logs d'audit en CSV, en flux continu depuis le curseur Mongo"""
+    await audit_log.flush()
+    query = date_range_filter(date_from, date_to)
+    if action:
+        query["action"] = action
+    if target_type:
+        query["target_type"] = target_type
+    projection = {"_id": 0, **{name: 1 for name, _ in AUDIT_EXPORT_COLUMNS}}
+    cursor = db.audit_logs.find(query, projection).sort("created_at", -1)
+    filename = "audit.csv.gz" if gzip else "audit.csv"
     return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=audit.csv"}
+        stream_csv(cursor, AUDIT_EXPORT_COLUMNS, compress=gzip),
+        media_type="application/gzip" if gzip else "text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
+
 @api_router.get("/admin/reviews")
 async def admin_reviews(
     current_user: dict = Depends(require_admin),
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
-    verified: Optional[str] = Query(None)
+    verified: Optional[str] = Query(None),
+    after: Optional[str] = Query(None, description="Curseur opaque (vide pour la 1re page) : active la pagination par curseur"),
+    with_total: bool = Query(True)
 ):
     query = {}
     if verified == "true":
         query["verified"] = True
     elif verified == "false":
         query["verified"] = {"$ne": True}
-    total = await db.ratings.count_documents(query)
+    if after is not None:
+        reviews, next_cursor = await keyset_page(db.ratings, query, limit, after or None)
+        return {
+            "reviews": [clean_mongo_doc(r) for r in reviews],
+            "next_cursor": next_cursor,
+            "limit": limit,
+            "total": await count_cache.count(db.ratings, query) if with_total else None
+        }
+    total = await count_cache.count(db.ratings, query)
     skip = (page - 1) * limit
     reviews = await db.ratings.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
     return {
@@ -1290,47 +1529,33 @@ async def admin_reviews(
 
 @api_router.put("/admin/reviews/{review_id}/verify")
 async def admin_verify_review(review_id: str, current_user: dict = Depends(require_admin)):
-    await db.ratings.update_one({"id": review_id}, {"$set": {"verified": True, "verified_at": DateUtils.to_iso(DateUtils.now()), "verified_by": current_user["id"]}})
-    await db.audit_logs.insert_one({
-        "id": str(uuid.uuid4()),
-        "admin_id": current_user["id"],
-        "admin_email": current_user.get("email"),
-        "action": "review_verified",
-        "target_type": "review",
-        "target_id": review_id,
-        "details": {},
-        "created_at": DateUtils.to_iso(DateUtils.now())
-    })
+    review = await db.ratings.find_one_and_update(
+        {"id": review_id}, {"$set": {"verified": True, "verified_at": DateUtils.to_iso(DateUtils.now()), "verified_by": current_user["id"]}}
+    )
+    if review and await record_rating_change(db, review, {**review, "verified": True}):
+        await refresh_worker(review["worker_id"])
+    reviews_cache.invalidate()
+    admin_stats_cache.invalidate()
+    await audit_log.record(current_user, "review_verified", "review", review_id)
     return {"status": "success"}
 
 @api_router.put("/admin/reviews/{review_id}/hide")
 async def admin_hide_review(review_id: str, current_user: dict = Depends(require_admin)):
-    await db.ratings.update_one({"id": review_id}, {"$set": {"visible": False}})
-    await db.audit_logs.insert_one({
-        "id": str(uuid.uuid4()),
-        "admin_id": current_user["id"],
-        "admin_email": current_user.get("email"),
-        "action": "review_hidden",
-        "target_type": "review",
-        "target_id": review_id,
-        "details": {},
-        "created_at": DateUtils.to_iso(DateUtils.now())
-    })
+    review = await db.ratings.find_one_and_update({"id": review_id}, {"$set": {"visible": False}})
+    if review and await record_rating_change(db, review, {**review, "visible": False}):
+        await refresh_worker(review["worker_id"])
+    reviews_cache.invalidate()
+    await audit_log.record(current_user, "review_hidden", "review", review_id)
     return {"status": "success"}
 
 @api_router.delete("/admin/reviews/{review_id}")
 async def admin_delete_review(review_id: str, current_user: dict = Depends(require_admin)):
-    await db.ratings.delete_one({"id": review_id})
-    await db.audit_logs.insert_one({
-        "id": str(uuid.uuid4()),
-        "admin_id": current_user["id"],
-        "admin_email": current_user.get("email"),
-        "action": "review_deleted",
-        "target_type": "review",
-        "target_id": review_id,
-        "details": {},
-        "created_at": DateUtils.to_iso(DateUtils.now())
-    })
+    review = await db.ratings.find_one_and_delete({"id": review_id})
+    if review and await record_rating_change(db, review, None):
+        await refresh_worker(review["worker_id"])
+    reviews_cache.invalidate()
+    admin_stats_cache.invalidate()
+    await audit_log.record(current_user, "review_deleted", "review", review_id)
     return {"status": "success"}
 
 @api_router.post("/admin/users")
@@ -1344,7 +1569,7 @@ async def admin_create_user(payload: Dict[Any, Any], current_user: dict = Depend
     password = payload.get("password")
     if not password:
         password = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(12))
-    password_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    password_hash = await password_hasher.hash(password)
     new_user = {
         "id": str(uuid.uuid4()),
         "email": email,
@@ -1356,18 +1581,13 @@ async def admin_create_user(payload: Dict[Any, Any], current_user: dict = Depend
         "created_at": DateUtils.to_iso(DateUtils.now()),
         "created_by": current_user["id"]
     }
-    await db.users.insert_one(new_user)
-    await db.audit_logs.insert_one({
-        "id": str(uuid.uuid4()),
-        "admin_id": current_user["id"],
-        "admin_email": current_user.get("email"),
-        "action": "admin_created",
-        "target_type": "user",
-        "target_id": new_user["id"],
-        "target_email": email,
-        "details": {"role": new_user["role"]},
-        "created_at": DateUtils.to_iso(DateUtils.now())
-    })
+    try:
+        await db.users.insert_one(add_search_keys("users", with_location(new_user)))
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email déjà utilisé")
+    worker_index.upsert(new_user)
+    admin_stats_cache.invalidate()
+    await audit_log.record(current_user, "admin_created", "user", new_user["id"], target_email=email, details={"role": new_user["role"]})
     return {"status": "success", "user": clean_mongo_doc({k: v for k, v in new_user.items() if k != "password_hash"}), "generated_password": password}
 
 @api_router.get("/admin/disputes")
@@ -1380,6 +1600,7 @@ async def create_dispute(payload: Dict[Any, Any], current_user: dict = Depends(r
     payload["id"] = str(uuid.uuid4())
     payload["created_at"] = DateUtils.to_iso(DateUtils.now())
     await db.disputes.insert_one(payload)
+    admin_stats_cache.invalidate()
     return payload
 
 @api_router.get("/admin/notifications")
@@ -1403,19 +1624,30 @@ async def create_rating(payload: Dict[Any, Any], current_user: dict = Depends(ge
         "created_at": DateUtils.to_iso(DateUtils.now())
     }
     await db.ratings.insert_one(rating)
+    if await record_rating_change(db, None, rating):
+        await refresh_worker(rating["worker_id"])
+    reviews_cache.invalidate()
+    admin_stats_cache.invalidate()
     return clean_mongo_doc(rating)
 
 @api_router.get("/ratings/public")
 @api_router.get("/reviews")
-async def get_public_ratings(limit: int = Query(20), verified: Optional[bool] = Query(None)):
-    """Retourne les avis vérifiés pour la landing page"""
-    query = {"visible": True}
-    if verified is not None:
-        query["verified"] = verified
-    else:
-        query["verified"] = True  # Par défaut, uniquement les avis vérifiés
-    reviews = await db.ratings.find(query).sort("created_at", -1).to_list(limit)
-    return [clean_mongo_doc(r) for r in reviews]
+async def get_public_ratings(
+    limit: int = Query(20),
+    verified: Optional[bool] = Query(None),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Retourne les avis vérifiés pour la landing page (liste rendue en cache, invalidée par toute écriture d'avis)"""
+    # Borné plutôt que refusé : les anciens clients envoient parfois des limites très hautes
+    limit = max(1, min(limit, PUBLIC_REVIEWS_MAX_LIMIT))
+    verified = True if verified is None else verified  # Par défaut, uniquement les avis vérifiés
+    key = (verified, limit)
+    entry = reviews_cache.get(key)
+    if not entry:
+        generation = reviews_cache.generation
+        reviews = await db.ratings.find({"visible": True, "verified": verified}).sort("created_at", -1).to_list(limit)
+        entry = reviews_cache.put(key, [clean_mongo_doc(r) for r in reviews], generation)
+    return reviews_cache.respond(entry, if_none_match)
 
 @api_router.get("/workers/{worker_id}/public")
 async def get_worker_public_profile(worker_id: str, current_user: dict = Depends(get_current_user)):
@@ -1424,21 +1656,32 @@ async def get_worker_public_profile(worker_id: str, current_user: dict = Depends
     if not worker:
         raise HTTPException(status_code=404, detail="Worker not found")
     worker = clean_mongo_doc(worker)
-    # Stats
-    total_completed = await db.applications.count_documents({"worker_id": worker_id, "status": ApplicationStatus.COMPLETED})
-    total_apps = await db.applications.count_documents({"worker_id": worker_id})
-    # Note moyenne
-    ratings = await db.ratings.find({"worker_id": worker_id, "verified": True}).to_list(100)
-    avg_rating = round(sum(r.get("rating", 0) for r in ratings) / len(ratings), 1) if ratings else None
-    worker["total_completed"] = total_completed
-    worker["total_applications"] = total_apps
-    worker["avg_rating"] = avg_rating
-    worker["ratings_count"] = len(ratings)
+    # Stats : réputation matérialisée sur le document (services/reputation.py)
+    counts = await get_worker_counters(db, worker_id)
+    worker["total_completed"] = worker.get("total_shifts_completed", 0)
+    worker["total_applications"] = counts.get("total", 0)
+    worker["avg_rating"] = worker.get("rating")
+    worker["ratings_count"] = worker.get("ratings_count", 0)
+    worker["rating_distribution"] = rating_distribution(worker)
+    worker.setdefault("badges", [])
     # Supprimer les infos sensibles
-    for key in ["date_of_birth", "address", "postal_code", "billing_address", "billing_postal_code", "iban", "bic"]:
+    for key in ["date_of_birth", "address", "postal_code", "location", "rating_sum", "billing_address", "billing_postal_code", "iban", "bic"]:
         worker.pop(key, None)
     return worker
 
+@api_router.get("/admin/metrics")
+async def admin_metrics(current_user: dict = Depends(require_admin)):
+    return {
+        "user_cache": user_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "uploads": upload_service.stats(),
+        "audit_log": audit_log.stats(),
+        "worker_index": worker_index.stats(),
+        "shift_feed_cache": shift_feed_cache.stats(),
+        "reviews_cache": reviews_cache.stats(),
+        "support_events": support_broker.stats()
+    }
+
 @api_router.get("/admin/settings")
 async def admin_settings():
     settings = await db.settings.find_one({"type": "general"})
@@ -1452,19 +1695,19 @@ async def update_admin_settings(payload: Dict[Any, Any], current_user: dict = De
     return {"status": "success"}
 
 @api_router.get("/admin/revenue")
-async def admin_revenue(current_user: dict = Depends(require_admin)):
-    shifts = await db.shifts.find({}).to_list(None)
-    total_revenue = 0
-    for s in shifts:
-        rate = s.get("hourly_rate", 0)
-        total_revenue += rate * 0.15
-    return {
-        "total_revenue": round(total_revenue, 2),
-        "commission_rate": 0.15
-    }
+async def admin_revenue(
+    current_user: dict = Depends(require_admin),
+    month_from: Optional[str] = Query(None, description="YYYY-MM"),
+    month_to: Optional[str] = Query(None, description="YYYY-MM")
+):
+    return await get_revenue_summary(db, month_from, month_to)
 
 app.include_router(api_router)
 
+if STORAGE_BACKEND == "local":
+    from fastapi.staticfiles import StaticFiles
+    app.mount("/uploads", StaticFiles(directory=LOCAL_UPLOAD_DIR), name="uploads")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=10000)
@@ -0,0 +1,83 @@
+from typing import Dict, Optional
+from datetime import datetime, timedelta, timezone
+import asyncio
+import time
+
+from services.revenue import get_total_revenue
+
+
+def _count(facet: list) -> int:
+    return facet[0]["count"] if facet else 0
+
+
+class AdminStatsService:
+    """Instantané des statistiques du dashboard admin, mis en cache quelques secondes"""
+
+    def __init__(self, ttl_seconds: int = 30):
+        self.ttl_seconds = ttl_seconds
+        self._snapshot: Optional[Dict] = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        """À appeler après une écriture qui modifie les chiffres du dashboard"""
+        self._snapshot = None
+        self._expires_at = 0.0
+
+    async def get(self, db, force: bool = False) -> Dict:
+        if not force and self._snapshot and time.monotonic() < self._expires_at:
+            return self._snapshot
+        async with self._lock:
+            # Un autre appel a pu recalculer pendant l'attente du verrou
+            if not force and self._snapshot and time.monotonic() < self._expires_at:
+                return self._snapshot
+            snapshot = await self.compute(db)
+            self._snapshot = snapshot
+            self._expires_at = time.monotonic() + self.ttl_seconds
+            return snapshot
+
+    async def compute(self, db) -> Dict:
+        now = datetime.now(timezone.utc)
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
+        week_ago = (now - timedelta(days=7)).isoformat()
+        count = [{"$count": "count"}]
+
+        users, shifts, applications, revenue, open_threads, open_disputes, pending_reviews = await asyncio.gather(
+            db.users.aggregate([{"$facet": {
+                "by_role": [{"$group": {"_id": "$role", "count": {"$sum": 1}}}],
+                "pending_workers": [{"$match": {"role": "worker", "verification_status": "pending"}}, *count],
+                "pending_hotels": [{"$match": {"role": "hotel", "verification_status": "unverified"}}, *count],
+                "active_7d": [{"$match": {"last_seen_at": {"$gte": week_ago}}}, *count],
+            }}]).to_list(1),
+            db.shifts.aggregate([{"$facet": {
+                "total": count,
+                "today": [{"$match": {"created_at": {"$gte": today}}}, *count],
+            }}]).to_list(1),
+            db.applications.count_documents({"created_at": {"$gte": today}}),
+            get_total_revenue(db),
+            db.support_threads.count_documents({"status": "open"}),
+            db.disputes.count_documents({"status": "open"}),
+            db.ratings.count_documents({"verified": {"$ne": True}}),
+        )
+
+        users, shifts = users[0], shifts[0]
+        by_role = {g["_id"]: g["count"] for g in users["by_role"]}
+        pending_workers = _count(users["pending_workers"])
+        pending_hotels = _count(users["pending_hotels"])
+        return {
+            "total_users": sum(by_role.values()),
+            "total_workers": by_role.get("worker", 0),
+            "total_hotels": by_role.get("hotel", 0),
+            "pending_workers": pending_workers,
+            "pending_hotels": pending_hotels,
+            "pending_verifications": pending_workers + pending_hotels,
+            "total_shifts": _count(shifts["total"]),
+            "revenue": revenue,
+            "open_support_threads": open_threads,
+            "open_disputes": open_disputes,
+            "pending_reviews": pending_reviews,
+            "shifts_today": _count(shifts["today"]),
+            "active_users_7d": _count(users["active_7d"]),
+            "applications_today": applications,
+            "computed_at": now.isoformat(),
+        }
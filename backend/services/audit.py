@@ -0,0 +1,148 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import uuid
+
+from pymongo.errors import BulkWriteError
+
+from services.search import add_search_keys
+
+logger = logging.getLogger("myshifters")
+
+DUPLICATE_KEY = 11000
+
+
+class AuditLogWriter:
+    """Journal d'audit bufferisé : les routes admin n'attendent plus l'écriture, insert_many par lots"""
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 1.0, max_queue: int = 5000,
+                 max_attempts: int = 5):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._db = None
+        self._queue: List[Dict] = []
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Task] = None
+        # Tentatives d'écriture par entrée : une entrée refusée à chaque fois finit par être abandonnée
+        self._attempts: Dict[str, int] = {}
+        self.written = 0
+        self.failed_batches = 0
+        self.dropped = 0
+
+    def start(self, db) -> None:
+        """Démarre la vidange périodique (hook startup)"""
+        self._db = db
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def record(self, admin: Dict, action: str, target_type: str, target_id: str,
+                     target_email: Optional[str] = None, details: Optional[Dict] = None) -> Dict:
+        """Met une entrée en file ; la file pleine force une vidange, et si elle reste pleine l'entrée
+        est abandonnée (journalisée et comptée) plutôt que de laisser la file grossir sans limite"""
+        entry = add_search_keys("audit_logs", {
+            "id": str(uuid.uuid4()),
+            "admin_id": admin["id"],
+            "admin_email": admin.get("email"),
+            "action": action,
+            "target_type": target_type,
+            "target_id": target_id,
+            "target_email": target_email,
+            "details": details or {},
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        })
+        if len(self._queue) >= self.max_queue:
+            await self.flush()
+            if len(self._queue) >= self.max_queue:
+                # Mongo toujours indisponible : la file reste bornée, l'entrée n'est conservée que dans les logs
+                self._drop([entry], "queue full")
+                return entry
+        self._queue.append(entry)
+        if self._task is None:
+            # Pas de boucle de fond (scripts, tests) : écriture immédiate
+            await self.flush()
+        elif len(self._queue) >= self.batch_size and (self._flushing is None or self._flushing.done()):
+            self._flushing = asyncio.create_task(self.flush())
+        return entry
+
+    async def flush(self) -> int:
+        """Écrit tout ce qui est en file ; retourne le nombre d'entrées insérées"""
+        if self._db is None:
+            return 0
+        async with self._lock:
+            written = 0
+            while self._queue:
+                batch = self._queue[:self.batch_size]
+                del self._queue[:self.batch_size]
+                # insert_many fixe _id sur chaque entrée : une entrée déjà écrite puis rejouée
+                # revient en doublon (11000) et compte comme écrite
+                try:
+                    await self._db.audit_logs.insert_many(batch, ordered=False)
+                    failed = []
+                except BulkWriteError as e:
+                    errors = e.details.get("writeErrors", [])
+                    failed = [batch[err["index"]] for err in errors if err.get("code") != DUPLICATE_KEY]
+                    if failed:
+                        logger.error(f"Audit log flush: {len(failed)}/{len(batch)} entries rejected: {errors[0].get('errmsg')}")
+                except Exception as e:
+                    logger.error(f"Audit log flush failed ({len(batch)} entries): {e}")
+                    failed = batch
+                written += len(batch) - len(failed)
+                failed_ids = {entry["id"] for entry in failed}
+                for entry in batch:
+                    if entry["id"] not in failed_ids:
+                        self._attempts.pop(entry["id"], None)
+                if failed:
+                    self.failed_batches += 1
+                    self._requeue(failed)
+                    break
+            self.written += written
+            return written
+
+    def _requeue(self, entries: List[Dict]) -> None:
+        """Remet les entrées en échec en tête de file, dans la limite des tentatives et de max_queue"""
+        retry, exhausted = [], []
+        for entry in entries:
+            attempts = self._attempts.get(entry["id"], 0) + 1
+            self._attempts[entry["id"]] = attempts
+            (exhausted if attempts >= self.max_attempts else retry).append(entry)
+        room = max(self.max_queue - len(self._queue), 0)
+        self._drop(exhausted, f"{self.max_attempts} failed attempts")
+        self._drop(retry[room:], "queue full")
+        self._queue[:0] = retry[:room]
+
+    def _drop(self, entries: List[Dict], reason: str) -> None:
+        for entry in entries:
+            self._attempts.pop(entry["id"], None)
+            self.dropped += 1
+            logger.error(
+                f"Audit log entry dropped ({reason}): id={entry['id']} action={entry['action']} "
+                f"admin={entry.get('admin_email')} target={entry['target_type']}:{entry['target_id']} "
+                f"at={entry['created_at']} details={entry.get('details')}"
+            )
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Audit log writer error: {e}")
+
+    async def close(self) -> None:
+        """Arrête la boucle et vide la file (hook shutdown)"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "queued": len(self._queue),
+            "written": self.written,
+            "failed_batches": self.failed_batches,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,61 @@
+from typing import Dict, Optional
+
+# Statuts suivis par les compteurs de candidatures d'un worker
+APPLICATION_STATUSES = ["pending", "accepted", "rejected", "completed"]
+# Tentatives de correction après l'initialisation concurrente des compteurs
+SEED_ATTEMPTS = 3
+
+
+async def count_applications_by_status(db, worker_id: str) -> Dict[str, int]:
+    """Compte les candidatures d'un worker par statut en une seule agrégation"""
+    groups = await db.applications.aggregate([
+        {"$match": {"worker_id": worker_id}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+    ]).to_list(None)
+    counts = {status: 0 for status in APPLICATION_STATUSES}
+    for g in groups:
+        if g["_id"] in counts:
+            counts[g["_id"]] = g["count"]
+    counts["total"] = sum(g["count"] for g in groups)
+    return counts
+
+
+async def get_worker_counters(db, worker_id: str) -> Dict[str, int]:
+    """Lecture ponctuelle des compteurs, initialisés depuis les candidatures au premier appel"""
+    counters = await db.worker_counters.find_one({"worker_id": worker_id}, {"_id": 0, "worker_id": 0})
+    if counters:
+        return counters
+    counts = await count_applications_by_status(db, worker_id)
+    # $setOnInsert : si un autre appel vient d'initialiser le document, on ne l'écrase pas
+    result = await db.worker_counters.update_one({"worker_id": worker_id}, {"$setOnInsert": counts}, upsert=True)
+    if result.upserted_id is None:
+        return await db.worker_counters.find_one({"worker_id": worker_id}, {"_id": 0, "worker_id": 0})
+    # Un $inc peut manquer (arrivé avant l'upsert) ou compter deux fois (candidature déjà comptée par
+    # l'agrégation, $inc arrivé après l'upsert) : on compare le document stocké à un recomptage et on
+    # corrige par un $set conditionnel, rejoué si un autre $inc est passé entre-temps
+    for _ in range(SEED_ATTEMPTS):
+        stored = await db.worker_counters.find_one({"worker_id": worker_id}, {"_id": 0, "worker_id": 0})
+        fresh = await count_applications_by_status(db, worker_id)
+        if fresh == stored:
+            return fresh
+        result = await db.worker_counters.update_one({"worker_id": worker_id, **stored}, {"$set": fresh})
+        if result.matched_count:
+            return fresh
+    return await db.worker_counters.find_one({"worker_id": worker_id}, {"_id": 0, "worker_id": 0})
+
+
+async def record_application_created(db, worker_id: str, status: str = "pending") -> None:
+    # Pas d'upsert : un document absent sera initialisé à la prochaine lecture, mutation comprise
+    await db.worker_counters.update_one({"worker_id": worker_id}, {"$inc": {"total": 1, status: 1}})
+
+
+async def record_status_change(db, worker_id: str, old_status: Optional[str], new_status: Optional[str]) -> None:
+    if old_status == new_status:
+        return
+    inc = {}
+    if old_status in APPLICATION_STATUSES:
+        inc[old_status] = -1
+    if new_status in APPLICATION_STATUSES:
+        inc[new_status] = 1
+    if inc:
+        await db.worker_counters.update_one({"worker_id": worker_id}, {"$inc": inc})
@@ -0,0 +1,121 @@
+from typing import Dict, Optional
+from datetime import datetime, timedelta, timezone
+import logging
+import uuid
+
+logger = logging.getLogger("myshifters")
+
+# Statuts de candidature qui donnent lieu à une ligne du registre des gains
+EARNING_STATUSES = ["accepted", "completed"]
+
+
+def shift_duration_hours(start_time: Optional[str], end_time: Optional[str]) -> float:
+    """Durée d'un shift en heures, les missions de nuit passant au lendemain"""
+    try:
+        start = datetime.strptime(start_time or "00:00", "%H:%M")
+        end = datetime.strptime(end_time or "00:00", "%H:%M")
+    except ValueError:
+        logger.error(f"Horaires invalides pour le calcul de durée: {start_time} - {end_time}")
+        return 0.0
+    if end <= start:
+        end += timedelta(days=1)
+    return (end - start).total_seconds() / 3600
+
+
+def build_ledger_entry(app: Dict, shift: Dict) -> Dict:
+    """Ligne du registre des gains pour une candidature acceptée / complétée"""
+    duration = shift_duration_hours(shift.get("start_time"), shift.get("end_time"))
+    hourly_rate = shift.get("hourly_rate") or 0
+    return {
+        "application_id": app["id"],
+        "worker_id": app["worker_id"],
+        "shift_id": shift["id"],
+        "hotel_id": shift.get("hotel_id"),
+        "title": shift.get("title"),
+        "hotel_name": shift.get("hotel_name"),
+        "date": shift.get("dates", [""])[0] if shift.get("dates") else "",
+        "start_time": shift.get("start_time"),
+        "end_time": shift.get("end_time"),
+        "duration": round(duration, 2),
+        "hourly_rate": hourly_rate,
+        "amount": round(hourly_rate * duration, 2),
+        "status": app["status"],
+    }
+
+
+async def sync_earning(db, app: Dict, shift: Optional[Dict] = None) -> None:
+    """Écrit (ou retire) la ligne du registre correspondant à l'état courant de la candidature"""
+    if app.get("status") not in EARNING_STATUSES:
+        await db.earnings.delete_one({"application_id": app["id"]})
+        return
+    if shift is None:
+        shift = await db.shifts.find_one({"id": app["shift_id"]})
+    if not shift:
+        # Mission supprimée : plus rien à payer
+        await db.earnings.delete_one({"application_id": app["id"]})
+        return
+    now = datetime.now(timezone.utc).isoformat()
+    await db.earnings.update_one(
+        {"application_id": app["id"]},
+        {"$set": {**build_ledger_entry(app, shift), "updated_at": now},
+         "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now}},
+        upsert=True
+    )
+
+
+async def remove_shift_earnings(db, shift_id: str) -> int:
+    """Retire du registre les lignes d'une mission supprimée"""
+    result = await db.earnings.delete_many({"shift_id": shift_id})
+    return result.deleted_count
+
+
+async def get_worker_earnings_summary(db, worker_id: str, date_from: Optional[str] = None,
+                                      date_to: Optional[str] = None, details_limit: int = 200) -> Dict:
+    """Totaux et détail des gains d'un worker en une seule agrégation sur le registre"""
+    match = {"worker_id": worker_id}
+    if date_from or date_to:
+        match["date"] = {}
+        if date_from:
+            match["date"]["$gte"] = date_from
+        if date_to:
+            match["date"]["$lte"] = date_to
+    now = datetime.now(timezone.utc)
+    month_start = now.strftime("%Y-%m-01")
+    next_month_start = (now.replace(day=28) + timedelta(days=4)).strftime("%Y-%m-01")
+    pipeline = [
+        {"$match": match},
+        {"$facet": {
+            "by_status": [{"$group": {"_id": "$status", "amount": {"$sum": "$amount"}, "hours": {"$sum": "$duration"}}}],
+            "this_month": [
+                # Missions du mois courant uniquement, pas celles déjà planifiées les mois suivants
+                {"$match": {"date": {"$gte": month_start, "$lt": next_month_start}}},
+                {"$group": {"_id": None, "amount": {"$sum": "$amount"}}},
+            ],
+            "details": [{"$sort": {"date": -1}}, {"$limit": details_limit}, {"$project": {"_id": 0}}],
+        }},
+    ]
+    facets = (await db.earnings.aggregate(pipeline).to_list(1) or [{}])[0]
+    by_status = {g["_id"]: g for g in facets.get("by_status", [])}
+    paid = by_status.get("completed", {}).get("amount", 0)
+    pending = by_status.get("accepted", {}).get("amount", 0)
+    total = paid + pending
+    this_month = facets["this_month"][0]["amount"] if facets.get("this_month") else 0
+    details = [{**d, "earned": d.get("amount", 0)} for d in facets.get("details", [])]
+    return {
+        "total_earnings": round(total, 2),
+        "total": round(total, 2),
+        "paid": round(paid, 2),
+        "pending": round(pending, 2),
+        "thisMonth": round(this_month, 2),
+        "total_hours": round(sum(g.get("hours", 0) for g in by_status.values()), 2),
+        "details": details,
+    }
+
+
+async def backfill_earnings(db) -> int:
+    """Reconstruit le registre à partir des candidatures existantes (migration ponctuelle)"""
+    count = 0
+    async for app in db.applications.find({"status": {"$in": EARNING_STATUSES}}):
+        await sync_earning(db, app)
+        count += 1
+    return count
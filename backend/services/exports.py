@@ -0,0 +1,55 @@
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+import csv
+import io
+import zlib
+
+# (en-tête CSV, fonction qui extrait la valeur d'un document)
+CsvColumn = Tuple[str, Callable[[Dict], object]]
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def field(name: str) -> Callable[[Dict], object]:
+    return lambda doc: doc.get(name, "")
+
+
+def date_range_filter(date_from: Optional[str], date_to: Optional[str], key: str = "created_at") -> Dict:
+    """Bornes ISO sur created_at ; date_to est inclusive sur toute la journée"""
+    if not date_from and not date_to:
+        return {}
+    bounds = {}
+    if date_from:
+        bounds["$gte"] = date_from
+    if date_to:
+        bounds["$lte"] = f"{date_to}\uffff"
+    return {key: bounds}
+
+
+async def stream_csv(cursor, columns: List[CsvColumn], compress: bool = False,
+                     batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Génère le CSV au fil du curseur Mongo, un bloc par lot : mémoire constante quelle que soit la taille"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # wbits=31 : en-tête et checksum gzip, le fichier s'ouvre directement avec gunzip
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def flush() -> bytes:
+        chunk = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(chunk) if compressor else chunk
+
+    writer.writerow([header for header, _ in columns])
+    rows = 0
+    async for doc in cursor.batch_size(batch_size):
+        writer.writerow([getter(doc) for _, getter in columns])
+        rows += 1
+        if rows % batch_size == 0:
+            chunk = flush()
+            if chunk:
+                yield chunk
+    chunk = flush()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
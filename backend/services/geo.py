@@ -0,0 +1,169 @@
+from typing import Dict, Iterable, Optional, Tuple
+import csv
+import logging
+
+import numpy as np
+from fastapi import HTTPException
+
+logger = logging.getLogger("myshifters")
+
+EARTH_RADIUS_KM = 6378.1
+
+# Coordonnées (lat, lon) de la préfecture de chaque département : table hors ligne,
+# précise à l'échelle du département (quelques dizaines de km)
+DEPARTMENT_CENTROIDS: Dict[str, Tuple[float, float]] = {
+    "01": (46.205, 5.225), "02": (49.564, 3.620), "03": (46.566, 3.333), "04": (44.092, 6.236),
+    "05": (44.559, 6.079), "06": (43.710, 7.262), "07": (44.735, 4.599), "08": (49.762, 4.726),
+    "09": (42.965, 1.607), "10": (48.297, 4.074), "11": (43.213, 2.353), "12": (44.350, 2.575),
+    "13": (43.296, 5.370), "14": (49.183, -0.371), "15": (44.926, 2.440), "16": (45.648, 0.156),
+    "17": (46.160, -1.151), "18": (47.081, 2.399), "19": (45.267, 1.770), "21": (47.322, 5.041),
+    "22": (48.514, -2.765), "23": (46.171, 1.871), "24": (45.184, 0.721), "25": (47.238, 6.024),
+    "26": (44.933, 4.892), "27": (49.024, 1.151), "28": (48.446, 1.489), "29": (47.996, -4.102),
+    "2A": (41.919, 8.738), "2B": (42.697, 9.451), "30": (43.837, 4.360), "31": (43.605, 1.444),
+    "32": (43.646, 0.586), "33": (44.838, -0.579), "34": (43.611, 3.877), "35": (48.117, -1.678),
+    "36": (46.811, 1.686), "37": (47.394, 0.685), "38": (45.188, 5.724), "39": (46.675, 5.555),
+    "40": (43.894, -0.500), "41": (47.586, 1.336), "42": (45.440, 4.387), "43": (45.043, 3.885),
+    "44": (47.218, -1.554), "45": (47.903, 1.909), "46": (44.447, 1.441), "47": (44.203, 0.616),
+    "48": (44.518, 3.500), "49": (47.478, -0.563), "50": (49.116, -1.091), "51": (48.957, 4.365),
+    "52": (48.111, 5.139), "53": (48.073, -0.770), "54": (48.692, 6.184), "55": (48.773, 5.160),
+    "56": (47.658, -2.760), "57": (49.120, 6.176), "58": (46.990, 3.159), "59": (50.629, 3.057),
+    "60": (49.430, 2.081), "61": (48.432, 0.091), "62": (50.291, 2.777), "63": (45.778, 3.087),
+    "64": (43.295, -0.371), "65": (43.233, 0.078), "66": (42.699, 2.895), "67": (48.573, 7.752),
+    "68": (48.079, 7.358), "69": (45.764, 4.836), "70": (47.622, 6.156), "71": (46.307, 4.828),
+    "72": (48.006, 0.199), "73": (45.564, 5.918), "74": (45.899, 6.129), "75": (48.857, 2.352),
+    "76": (49.443, 1.100), "77": (48.539, 2.661), "78": (48.801, 2.130), "79": (46.323, -0.459),
+    "80": (49.894, 2.296), "81": (43.929, 2.148), "82": (44.018, 1.355), "83": (43.124, 5.928),
+    "84": (43.949, 4.806), "85": (46.670, -1.426), "86": (46.580, 0.340), "87": (45.834, 1.261),
+    "88": (48.174, 6.449), "89": (47.798, 3.567), "90": (47.640, 6.863), "91": (48.629, 2.441),
+    "92": (48.892, 2.207), "93": (48.908, 2.440), "94": (48.790, 2.455), "95": (49.036, 2.076),
+    "971": (15.998, -61.726), "972": (14.616, -61.059), "973": (4.938, -52.335),
+    "974": (-20.882, 55.450), "976": (-12.781, 45.228),
+}
+
+# Table fine code postal -> (lat, lon), chargée depuis POSTAL_CODES_FILE si fournie
+POSTAL_CODES: Dict[str, Tuple[float, float]] = {}
+
+
+def load_postal_codes(path: str) -> int:
+    """CSV avec en-tête postal_code,latitude,longitude (séparateur , ou ;)"""
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            dialect = csv.Sniffer().sniff(f.read(2048), delimiters=",;")
+            f.seek(0)
+            for row in csv.DictReader(f, dialect=dialect):
+                code = (row.get("postal_code") or "").strip()
+                try:
+                    POSTAL_CODES.setdefault(code, (float(row["latitude"]), float(row["longitude"])))
+                except (KeyError, TypeError, ValueError):
+                    continue
+    except OSError as e:
+        logger.error(f"Postal code table {path} not loaded: {e}")
+    return len(POSTAL_CODES)
+
+
+def _department(code: str) -> str:
+    if code.startswith("97"):
+        return code[:3]
+    if code.startswith("20"):
+        return "2A" if code < "20200" else "2B"
+    return code[:2]
+
+
+def geocode(postal_code: Optional[str]) -> Optional[Tuple[float, float]]:
+    """(lat, lon) d'un code postal français : table fine si dispo, sinon centre du département"""
+    code = str(postal_code or "").strip()
+    if len(code) != 5 or not code.isdigit():
+        return None
+    return POSTAL_CODES.get(code) or DEPARTMENT_CENTROIDS.get(_department(code))
+
+
+def point(lat: float, lon: float) -> Dict:
+    # GeoJSON : longitude d'abord
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+
+def location_of(postal_code: Optional[str]) -> Optional[Dict]:
+    coords = geocode(postal_code)
+    return point(*coords) if coords else None
+
+
+def with_location(doc: Dict) -> Dict:
+    """Complète un document avant insertion ; retourne le même dict pour un usage en ligne"""
+    location = location_of(doc.get("postal_code"))
+    if location:
+        doc["location"] = location
+    return doc
+
+
+def coordinates(location: Optional[Dict]) -> Optional[Tuple[float, float]]:
+    """(lat, lon) d'un point GeoJSON stocké"""
+    try:
+        lon, lat = location["coordinates"]
+        return float(lat), float(lon)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distance orthodromique ; accepte des scalaires ou des tableaux NumPy (mêmes opérations)"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def distance_between(a: Optional[Dict], b: Optional[Dict]) -> Optional[float]:
+    ca, cb = coordinates(a), coordinates(b)
+    if not ca or not cb:
+        return None
+    return float(haversine_km(ca[0], ca[1], cb[0], cb[1]))
+
+
+def parse_near(near: str) -> Tuple[float, float]:
+    """'75011' ou 'lat,lon' -> (lat, lon) ; 400 si illisible"""
+    if "," in near:
+        try:
+            lat, lon = (float(v) for v in near.split(",", 1))
+            if -90 <= lat <= 90 and -180 <= lon <= 180:
+                return lat, lon
+        except ValueError:
+            pass
+    else:
+        coords = geocode(near)
+        if coords:
+            return coords
+    raise HTTPException(status_code=400, detail="Invalid near: expected a postal code or 'lat,lon'")
+
+
+def within_radius(lat: float, lon: float, radius_km: float, field: str = "location") -> Dict:
+    """Filtre servi par l'index 2dsphere (pas de tri par distance, le tri de la liste est conservé)"""
+    return {field: {"$geoWithin": {"$centerSphere": [[lon, lat], radius_km / EARTH_RADIUS_KM]}}}
+
+
+async def refresh_location(db, collection: str, query: Dict, changed_fields: Optional[Iterable[str]] = None) -> None:
+    """Recalcule location après une mise à jour du code postal"""
+    if changed_fields is not None and "postal_code" not in changed_fields:
+        return
+    doc = await db[collection].find_one(query, {"postal_code": 1})
+    if doc:
+        location = location_of(doc.get("postal_code"))
+        update = {"$set": {"location": location}} if location else {"$unset": {"location": ""}}
+        await db[collection].update_one({"_id": doc["_id"]}, update)
+
+
+async def backfill_locations(db) -> int:
+    """Géocode les utilisateurs, puis les shifts d'après le code postal de leur hôtel"""
+    count = 0
+    hotels = {}
+    async for user in db.users.find({"postal_code": {"$exists": True}}, {"id": 1, "role": 1, "postal_code": 1}):
+        location = location_of(user.get("postal_code"))
+        if location:
+            await db.users.update_one({"_id": user["_id"]}, {"$set": {"location": location}})
+            count += 1
+            if user.get("role") == "hotel":
+                hotels[user.get("id")] = location
+    async for shift in db.shifts.find({}, {"hotel_id": 1}):
+        location = hotels.get(shift.get("hotel_id"))
+        if location:
+            await db.shifts.update_one({"_id": shift["_id"]}, {"$set": {"location": location}})
+            count += 1
+    return count
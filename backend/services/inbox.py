@@ -0,0 +1,70 @@
+from typing import Dict, List, Optional
+
+from services.pagination import keyset_filter, split_page
+
+# Champs du worker exposés à l'hôtel dans sa boîte de candidatures
+WORKER_INBOX_FIELDS = {"_id": 0, "first_name": 1, "last_name": 1, "phone": 1}
+
+
+def build_hotel_inbox_pipeline(hotel_id: str, status: Optional[str] = None, shift_id: Optional[str] = None,
+                               limit: int = 50, after: Optional[str] = None, with_totals: bool = True) -> List[Dict]:
+    """Pipeline unique : shifts de l'hôtel -> candidatures -> worker, avec totaux via $facet
+    (with_totals=False : seule la page est calculée, sans parcourir toutes les candidatures)"""
+    shift_match = {"hotel_id": hotel_id}
+    if shift_id:
+        shift_match["id"] = shift_id
+    status_match = {"status": status} if status else {}
+    page_match = {**status_match, **keyset_filter(after)}
+    return [
+        {"$match": shift_match},
+        {"$project": {"_id": 0, "id": 1, "title": 1, "dates": 1, "start_time": 1}},
+        {"$lookup": {"from": "applications", "localField": "id", "foreignField": "shift_id", "as": "app"}},
+        {"$unwind": "$app"},
+        {"$addFields": {
+            "app.shift_title": "$title",
+            "app.shift_date": {"$arrayElemAt": ["$dates", 0]},
+            "app.shift_start_time": "$start_time",
+        }},
+        {"$replaceRoot": {"newRoot": "$app"}},
+        {"$project": {"_id": 0}},
+        {"$facet": {
+            "items": [
+                {"$match": page_match},
+                {"$sort": {"created_at": -1, "id": -1}},
+                {"$limit": limit + 1},
+                {"$lookup": {
+                    "from": "users", "localField": "worker_id", "foreignField": "id", "as": "worker",
+                    "pipeline": [{"$project": WORKER_INBOX_FIELDS}],
+                }},
+                {"$addFields": {
+                    "worker_first_name": {"$arrayElemAt": ["$worker.first_name", 0]},
+                    "worker_last_name": {"$arrayElemAt": ["$worker.last_name", 0]},
+                    "worker_phone": {"$arrayElemAt": ["$worker.phone", 0]},
+                }},
+                {"$project": {"worker": 0}},
+            ],
+            **({
+                "total": [{"$match": status_match}, {"$count": "count"}],
+                "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            } if with_totals else {}),
+        }},
+    ]
+
+
+async def get_hotel_inbox(db, hotel_id: str, status: Optional[str] = None, shift_id: Optional[str] = None,
+                          limit: int = 50, after: Optional[str] = None) -> Dict:
+    """Boîte de candidatures d'un hôtel en un seul aller-retour Mongo ; les totaux ne sont
+    calculés que pour la première page (total / by_status valent None avec un curseur)"""
+    with_totals = not after
+    pipeline = build_hotel_inbox_pipeline(hotel_id, status, shift_id, limit, after, with_totals)
+    facets = await db.shifts.aggregate(pipeline).to_list(1)
+    facets = facets[0] if facets else {"items": [], "total": [], "by_status": []}
+    items, next_cursor = split_page(facets["items"], limit)
+    if not with_totals:
+        return {"applications": items, "total": None, "by_status": None, "next_cursor": next_cursor}
+    return {
+        "applications": items,
+        "total": facets["total"][0]["count"] if facets.get("total") else 0,
+        "by_status": {g["_id"]: g["count"] for g in facets.get("by_status", []) if g["_id"]},
+        "next_cursor": next_cursor,
+    }
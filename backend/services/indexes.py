@@ -0,0 +1,168 @@
+from typing import Dict, List, Tuple
+import logging
+
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+logger = logging.getLogger("myshifters")
+
+# Registre des index par collection, appliqué au démarrage de l'API
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("role", ASCENDING), ("verification_status", ASCENDING)]),
+        IndexModel([("last_seen_at", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("search_prefixes", ASCENDING)]),
+        IndexModel([("location", GEOSPHERE)]),
+    ],
+    "shifts": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("hotel_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("service_type", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("search_prefixes", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("location", GEOSPHERE)]),
+    ],
+    "applications": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("shift_id", ASCENDING), ("worker_id", ASCENDING)], unique=True),
+        IndexModel([("shift_id", ASCENDING), ("status", ASCENDING)]),
+        IndexModel([("worker_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("worker_id", ASCENDING), ("status", ASCENDING)]),
+        IndexModel([("created_at", DESCENDING)]),
+    ],
+    "documents": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING)]),
+    ],
+    "experiences": [IndexModel([("user_id", ASCENDING)])],
+    "payout_accounts": [IndexModel([("user_id", ASCENDING)], unique=True)],
+    "hotel_settings": [IndexModel([("hotel_id", ASCENDING)], unique=True)],
+    "invoices": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("worker_id", ASCENDING)]),
+        IndexModel([("hotel_id", ASCENDING)]),
+    ],
+    "suspensions": [IndexModel([("user_id", ASCENDING), ("suspended_at", DESCENDING)])],
+    "support_threads": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("search_prefixes", ASCENDING)]),
+        # Pastille admin : seules les conversations avec des non-lus
+        IndexModel([("unread_by_admin", ASCENDING)]),
+    ],
+    "support_messages": [
+        IndexModel([("thread_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("thread_id", ASCENDING), ("seq", ASCENDING)]),
+    ],
+    # Journal des événements push (backend "mongo") : purgé après une heure
+    "support_events": [IndexModel([("created_at", ASCENDING)], expireAfterSeconds=3600)],
+    "audit_logs": [
+        IndexModel([("target_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("action", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("search_prefixes", ASCENDING)]),
+    ],
+    "ratings": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("worker_id", ASCENDING), ("verified", ASCENDING)]),
+        IndexModel([("verified", ASCENDING), ("visible", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("verified", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "disputes": [IndexModel([("status", ASCENDING)])],
+    "earnings": [
+        IndexModel([("application_id", ASCENDING)], unique=True),
+        IndexModel([("worker_id", ASCENDING), ("date", DESCENDING)]),
+        IndexModel([("shift_id", ASCENDING)]),
+    ],
+    "commissions": [
+        IndexModel([("application_id", ASCENDING)], unique=True),
+        IndexModel([("shift_id", ASCENDING)]),
+    ],
+    "revenue_rollups": [IndexModel([("month", ASCENDING), ("hotel_id", ASCENDING)], unique=True)],
+    "worker_counters": [IndexModel([("worker_id", ASCENDING)], unique=True)],
+}
+
+# Requêtes chaudes de l'API : (collection, filtre, tri) dont le plan ne doit jamais être un COLLSCAN
+HOT_QUERIES: List[Tuple[str, Dict, List]] = [
+    ("users", {"email": "probe@myshifters.fr"}, []),
+    ("users", {"id": "probe"}, []),
+    ("users", {"role": "worker", "verification_status": "pending"}, []),
+    ("shifts", {"hotel_id": "probe"}, [("created_at", -1), ("id", -1)]),
+    ("shifts", {"status": "open"}, [("created_at", -1), ("id", -1)]),
+    ("shifts", {"status": "open", "service_type": "reception"}, [("created_at", -1), ("id", -1)]),
+    ("shifts", {"id": "probe"}, []),
+    ("shifts", {"status": "open", "location": {"$geoWithin": {"$centerSphere": [[2.35, 48.86], 25 / 6378.1]}}},
+     [("created_at", -1)]),
+    ("applications", {"shift_id": "probe", "worker_id": "probe"}, []),
+    ("applications", {"shift_id": {"$in": ["probe"]}, "status": {"$in": ["accepted", "completed"]}}, []),
+    ("applications", {"worker_id": "probe"}, [("created_at", -1), ("id", -1)]),
+    ("applications", {"worker_id": "probe", "status": "completed"}, []),
+    ("applications", {"created_at": {"$gte": "2024-01-01"}}, []),
+    ("documents", {"user_id": "probe"}, []),
+    ("support_threads", {"user_id": "probe"}, [("created_at", -1)]),
+    ("support_threads", {"status": "open"}, []),
+    ("support_messages", {"thread_id": "probe"}, [("created_at", -1), ("id", -1)]),
+    ("support_messages", {"thread_id": "probe", "seq": {"$gt": 0}}, [("seq", 1)]),
+    ("support_threads", {"status": "open"}, [("created_at", -1), ("id", -1)]),
+    ("support_threads", {"unread_by_admin": {"$gt": 0}}, []),
+    ("support_threads", {"unread_by_user": {"$gt": 0}, "user_id": "probe"}, []),
+    ("audit_logs", {"target_id": "probe"}, [("created_at", -1)]),
+    ("audit_logs", {}, [("created_at", -1), ("id", -1)]),
+    ("audit_logs", {"$or": [{"created_at": {"$lt": "2024-01-01"}}, {"created_at": "2024-01-01", "id": {"$lt": "probe"}}]},
+     [("created_at", -1), ("id", -1)]),
+    ("users", {}, [("created_at", -1), ("id", -1)]),
+    ("ratings", {"verified": True}, [("created_at", -1), ("id", -1)]),
+    ("ratings", {"verified": True, "visible": True}, [("created_at", -1)]),
+    ("ratings", {"worker_id": "probe", "verified": True}, []),
+    ("earnings", {"worker_id": "probe"}, [("date", -1)]),
+    ("worker_counters", {"worker_id": "probe"}, []),
+    ("users", {"search_prefixes": {"$all": ["jean", "dup"]}}, []),
+    ("shifts", {"search_prefixes": {"$all": ["recep"]}}, []),
+    ("support_threads", {"search_prefixes": {"$all": ["paie"]}}, []),
+    ("audit_logs", {"search_prefixes": {"$all": ["admin"]}}, []),
+]
+
+
+async def ensure_indexes(db) -> None:
+    """Crée les index déclarés ; idempotent, une erreur n'empêche pas le démarrage"""
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except ConnectionFailure as e:
+            # Cluster injoignable : inutile d'insister collection par collection, l'API démarre quand même
+            logger.error(f"Index creation skipped, database unreachable: {e}")
+            return
+        except PyMongoError as e:
+            # Ex. doublons existants sur un index unique : on signale sans bloquer l'API
+            logger.error(f"Index creation failed on {collection}: {e}")
+
+
+def _plan_stages(plan: Dict) -> List[str]:
+    stages = [plan.get("stage", "")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+async def find_collection_scans(db) -> List[str]:
+    """Retourne la liste des requêtes chaudes dont le plan gagnant passe par un COLLSCAN"""
+    offenders = []
+    for collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            offenders.append(f"{collection} {query} sort={sort}")
+    return offenders
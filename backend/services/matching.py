@@ -0,0 +1,54 @@
+from typing import Dict, Optional
+
+import numpy as np
+
+# Champs utiles au score : on ne lit jamais le document utilisateur complet
+WORKER_FEATURE_PROJECTION = {
+    "_id": 0, "id": 1, "role": 1, "is_suspended": 1, "first_name": 1, "last_name": 1, "city": 1,
+    "postal_code": 1, "location": 1, "skills": 1, "rating": 1, "experience_years": 1, "verification_status": 1,
+}
+
+
+def number(value, default: float) -> float:
+    try:
+        return float(value) if value is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+def matching_scores(skill_match: np.ndarray, rating: np.ndarray, experience: np.ndarray,
+                    verified: np.ndarray, distance_km: Optional[np.ndarray] = None) -> np.ndarray:
+    """Même barème et même ordre d'opérations que WorkerLogicService.calculate_matching_score ;
+    distance_km vaut NaN quand une des deux positions est inconnue"""
+    score = np.where(skill_match, 40.0, 0.0)
+    score = score + (rating / 5.0) * 30
+    score = score + np.minimum(experience * 4, 20)
+    score = score + np.where(verified, 10.0, 0.0)
+    if distance_km is not None:
+        known = ~np.isnan(distance_km)
+        penalty = np.minimum(np.where(known, distance_km, 0.0) / 5, 10)
+        score = np.where(known, np.maximum(score - penalty, 0), score)
+    return score
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices des k meilleurs scores, triés : argpartition O(n) puis tri des seuls k retenus"""
+    if k <= 0 or not len(scores):
+        return np.empty(0, dtype=np.intp)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def candidate_entry(worker: Dict, score: float, distance_km: float = float("nan")) -> Dict:
+    return {
+        "worker_id": worker.get("id"),
+        "first_name": worker.get("first_name"),
+        "last_name": worker.get("last_name"),
+        "city": worker.get("city"),
+        # Arrondi Python comme la version scalaire (np.round diffère sur certains x.x5)
+        "score": round(float(score), 1),
+        "distance_km": None if np.isnan(distance_km) else round(float(distance_km), 1),
+    }
@@ -0,0 +1,83 @@
+from typing import Dict, List, Optional, Tuple
+import base64
+import json
+import time
+
+from fastapi import HTTPException
+
+# Tri stable utilisé par toutes les listes paginées par curseur
+KEYSET_SORT = [("created_at", -1), ("id", -1)]
+
+
+def encode_cursor(doc: Dict) -> str:
+    """Encode la position (created_at, id) d'un document en curseur opaque"""
+    raw = json.dumps([doc.get("created_at") or "", doc.get("id") or ""])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Décode un curseur opaque, 400 si le client envoie n'importe quoi"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return str(created_at), str(doc_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(cursor: Optional[str], direction: int = -1) -> Dict:
+    """Filtre Mongo qui reprend la liste juste après le curseur (tri created_at, id)"""
+    if not cursor:
+        return {}
+    created_at, doc_id = decode_cursor(cursor)
+    op = "$lt" if direction < 0 else "$gt"
+    return {"$or": [
+        {"created_at": {op: created_at}},
+        {"created_at": created_at, "id": {op: doc_id}},
+    ]}
+
+
+def merge_filters(query: Dict, extra: Dict) -> Dict:
+    """Combine deux filtres sans écraser un éventuel $or déjà présent"""
+    if not extra:
+        return query
+    if not query:
+        return extra
+    return {"$and": [query, extra]}
+
+
+def split_page(docs: List[Dict], limit: int) -> Tuple[List[Dict], Optional[str]]:
+    """Les requêtes lisent limit + 1 documents : le surplus indique une page suivante"""
+    if len(docs) <= limit:
+        return docs, None
+    page = docs[:limit]
+    return page, encode_cursor(page[-1])
+
+
+async def keyset_page(collection, query: Dict, limit: int, after: Optional[str],
+                      projection: Optional[Dict] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Une page triée (created_at, id) décroissant, servie par un index range au lieu d'un skip"""
+    cursor = collection.find(merge_filters(query, keyset_filter(after)), projection)
+    docs = await cursor.sort(KEYSET_SORT).to_list(limit + 1)
+    return split_page(docs, limit)
+
+
+class CountCache:
+    """Totaux de pagination mis en cache quelques secondes"""
+
+    def __init__(self, ttl_seconds: int = 30, max_entries: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[str, Tuple[float, int]] = {}
+
+    async def count(self, collection, query: Dict) -> int:
+        key = f"{collection.name}:{json.dumps(query, sort_keys=True, default=str)}"
+        entry = self._entries.get(key)
+        if entry and time.monotonic() < entry[0]:
+            return entry[1]
+        # Sans filtre, les métadonnées de la collection suffisent
+        total = await (collection.estimated_document_count() if not query else collection.count_documents(query))
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, total)
+        return total
@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+import asyncio
+import time
+
+import bcrypt
+from fastapi import HTTPException
+
+
+class PasswordHasher:
+    """bcrypt exécuté dans un pool de threads borné pour ne pas bloquer la boucle asyncio"""
+
+    def __init__(self, rounds: int = 12, max_concurrency: int = 4, queue_timeout: float = 5.0):
+        self.rounds = rounds
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="bcrypt")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._in_flight = 0
+        self._calls = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+        self._rejected = 0
+
+    async def _run(self, fn, *args):
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._rejected += 1
+            raise HTTPException(status_code=503, detail="Service temporarily busy, please retry")
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._in_flight -= 1
+            self._calls += 1
+            self._total_seconds += elapsed
+            self._max_seconds = max(self._max_seconds, elapsed)
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._run(bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(rounds=self.rounds))
+        return hashed.decode("utf-8")
+
+    async def verify(self, password: str, stored_hash: str) -> bool:
+        """Lève ValueError si stored_hash n'est pas un hash bcrypt"""
+        return await self._run(bcrypt.checkpw, password.encode("utf-8"), stored_hash.encode("utf-8"))
+
+    def needs_rehash(self, stored_hash: str) -> bool:
+        """Vrai si le hash a été calculé avec un autre coût que celui configuré"""
+        try:
+            return int(stored_hash.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def stats(self) -> Dict:
+        return {
+            "rounds": self.rounds,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self._waiting,
+            "in_flight": self._in_flight,
+            "calls": self._calls,
+            "rejected": self._rejected,
+            "avg_ms": round(self._total_seconds / self._calls * 1000, 1) if self._calls else 0,
+            "max_ms": round(self._max_seconds * 1000, 1),
+        }
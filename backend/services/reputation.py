@@ -0,0 +1,111 @@
+from typing import Dict, Optional
+
+from pymongo import ReturnDocument
+
+from services.matching import number
+from services.worker_logic import WorkerLogicService
+
+# Compteurs tenus à jour par $inc ; rating et badges en sont dérivés
+REPUTATION_COUNTERS = ["total_shifts_completed", "rating_sum", "ratings_count"]
+# Champs de réputation écrits uniquement par ce module, jamais depuis un payload utilisateur
+REPUTATION_FIELDS = REPUTATION_COUNTERS + ["rating", "badges", "rating_distribution"]
+
+# Histogramme des notes : rating_distribution.1 … rating_distribution.5
+RATING_BUCKETS = ["1", "2", "3", "4", "5"]
+
+
+def counts_toward_rating(review: Optional[Dict]) -> bool:
+    """Seuls les avis vérifiés et non masqués entrent dans la note du worker"""
+    return bool(review and review.get("worker_id") and review.get("verified") and review.get("visible", True) is not False)
+
+
+def rating_bucket(value) -> str:
+    """Note arrondie à l'étoile entière, bornée à 1..5"""
+    return str(min(max(int(round(number(value, 0.0))), 1), 5))
+
+
+def rating_distribution(worker: Dict) -> Dict[str, int]:
+    dist = worker.get("rating_distribution") or {}
+    return {bucket: dist.get(bucket, 0) for bucket in RATING_BUCKETS}
+
+
+def reputation_update(counters: Dict) -> Dict:
+    """Note moyenne et badges dérivés des compteurs ; rating absent tant qu'aucun avis ne compte"""
+    count = counters.get("ratings_count") or 0
+    stats = {"total_shifts_completed": counters.get("total_shifts_completed") or 0}
+    if count > 0:
+        stats["rating"] = round(counters.get("rating_sum", 0) / count, 1)
+    # Sans avis comptés, pas de "top_rated" (calculate_badges suppose 5.0 quand la note manque)
+    update = {"$set": {"badges": WorkerLogicService.calculate_badges({"rating": 0, **stats})}}
+    if "rating" in stats:
+        update["$set"]["rating"] = stats["rating"]
+    else:
+        update["$unset"] = {"rating": ""}
+    return update
+
+
+async def _apply(db, worker_id: str, inc: Dict) -> bool:
+    counters = await db.users.find_one_and_update(
+        {"id": worker_id, "role": "worker"}, {"$inc": inc},
+        projection={f: 1 for f in REPUTATION_COUNTERS}, return_document=ReturnDocument.AFTER
+    )
+    if not counters:
+        return False
+    # Écriture conditionnelle : si un autre $inc est passé entre-temps, sa propre mise à jour (plus récente) gagne
+    await db.users.update_one({"id": worker_id, **{f: counters.get(f) for f in REPUTATION_COUNTERS}}, reputation_update(counters))
+    return True
+
+
+async def record_completion_change(db, worker_id: str, old_status: Optional[str], new_status: Optional[str]) -> bool:
+    """Candidature passée en (ou sortie de) 'completed' ; retourne True si le worker a été mis à jour"""
+    delta = int(new_status == "completed") - int(old_status == "completed")
+    if not delta or not worker_id:
+        return False
+    return await _apply(db, worker_id, {"total_shifts_completed": delta})
+
+
+async def record_rating_change(db, before: Optional[Dict], after: Optional[Dict]) -> bool:
+    """Avis créé / vérifié / masqué / supprimé : before ou after vaut None pour une création / suppression"""
+    was, now = counts_toward_rating(before), counts_toward_rating(after)
+    if was == now:
+        return False
+    review = after if now else before
+    sign = 1 if now else -1
+    return await _apply(db, review["worker_id"], {
+        "rating_sum": sign * number(review.get("rating"), 0.0), "ratings_count": sign,
+        f"rating_distribution.{rating_bucket(review.get('rating'))}": sign,
+    })
+
+
+async def backfill_reputation(db) -> int:
+    """Recalcule compteurs, note et badges de tous les workers depuis les candidatures et les avis"""
+    completed = {g["_id"]: g["count"] for g in await db.applications.aggregate([
+        {"$match": {"status": "completed"}},
+        {"$group": {"_id": "$worker_id", "count": {"$sum": 1}}},
+    ]).to_list(None)}
+    ratings: Dict[str, Dict] = {}
+    async for g in db.ratings.aggregate([
+        {"$match": {"verified": True, "visible": {"$ne": False}}},
+        {"$group": {"_id": {"worker_id": "$worker_id", "rating": "$rating"}, "count": {"$sum": 1}}},
+    ]):
+        stats = ratings.setdefault(g["_id"].get("worker_id"), {"rating_sum": 0, "ratings_count": 0, "rating_distribution": {}})
+        value = number(g["_id"].get("rating"), 0.0)
+        stats["rating_sum"] += value * g["count"]
+        stats["ratings_count"] += g["count"]
+        bucket = rating_bucket(value)
+        stats["rating_distribution"][bucket] = stats["rating_distribution"].get(bucket, 0) + g["count"]
+    count = 0
+    async for worker in db.users.find({"role": "worker"}, {"id": 1}):
+        worker_id = worker.get("id")
+        stats = ratings.get(worker_id, {})
+        counters = {
+            "total_shifts_completed": completed.get(worker_id, 0),
+            "rating_sum": stats.get("rating_sum", 0),
+            "ratings_count": stats.get("ratings_count", 0),
+        }
+        update = reputation_update(counters)
+        update["$set"].update(counters)
+        update["$set"]["rating_distribution"] = rating_distribution(stats)
+        await db.users.update_one({"_id": worker["_id"]}, update)
+        count += 1
+    return count
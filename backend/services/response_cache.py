@@ -0,0 +1,81 @@
+from typing import Dict, Hashable, NamedTuple, Optional
+import hashlib
+import json
+import time
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+
+
+class CachedBody(NamedTuple):
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+    expires: float
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match peut contenir plusieurs valeurs, faibles (W/) ou '*'"""
+    if not if_none_match:
+        return False
+    candidates = [v.strip().removeprefix("W/") for v in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+class ResponseCache:
+    """Réponses JSON publiques déjà sérialisées, avec ETag : un 304 ne touche ni Mongo ni le sérialiseur"""
+
+    def __init__(self, ttl_seconds: int = 30, max_entries: int = 256, max_age: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Durée de cache côté navigateur / CDN, plus courte que le TTL serveur par défaut
+        self.max_age = max_age if max_age is not None else min(ttl_seconds, 15)
+        self.generation = 0
+        self._entries: Dict[Hashable, CachedBody] = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key: Hashable) -> Optional[CachedBody]:
+        entry = self._entries.get(key)
+        if entry and time.monotonic() < entry.expires:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, payload, generation: int, headers: Optional[Dict[str, str]] = None) -> CachedBody:
+        """Sérialise et met en cache ; generation est lue avant la requête Mongo, un résultat
+        calculé pendant une invalidation est servi mais jamais stocké"""
+        body = json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        entry = CachedBody(
+            body=body,
+            etag=f'"{hashlib.sha1(body).hexdigest()[:20]}"',
+            headers=headers or {},
+            expires=time.monotonic() + self.ttl_seconds,
+        )
+        if generation == self.generation:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[key] = entry
+        return entry
+
+    def invalidate(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+
+    def respond(self, entry: CachedBody, if_none_match: Optional[str] = None) -> Response:
+        headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": f"public, max-age={self.max_age}"}
+        if etag_matches(if_none_match, entry.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "generation": self.generation,
+        }
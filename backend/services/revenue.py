@@ -0,0 +1,125 @@
+from typing import Dict, Optional
+from datetime import datetime, timezone
+from pymongo import ReturnDocument
+
+from services.earnings import shift_duration_hours
+
+# Commission prélevée par la plateforme sur le taux horaire du worker
+COMMISSION_RATE = 0.15
+
+
+def build_commission(app: Dict, shift: Dict) -> Dict:
+    """Commission réelle d'une mission complétée : (taux hôtel - taux worker) x durée"""
+    hourly_rate = shift.get("hourly_rate") or 0
+    hotel_hourly_rate = shift.get("hotel_hourly_rate") or round(hourly_rate * (1 + COMMISSION_RATE), 2)
+    duration = shift_duration_hours(shift.get("start_time"), shift.get("end_time"))
+    date = shift.get("dates", [""])[0] if shift.get("dates") else ""
+    return {
+        "application_id": app["id"],
+        "shift_id": shift["id"],
+        "worker_id": app["worker_id"],
+        "hotel_id": shift.get("hotel_id"),
+        "hotel_name": shift.get("hotel_name"),
+        "month": date[:7] or datetime.now(timezone.utc).strftime("%Y-%m"),
+        "hours": round(duration, 2),
+        "amount": round((hotel_hourly_rate - hourly_rate) * duration, 2),
+    }
+
+
+def _rounded(rows):
+    return [{**r, "total": round(r["total"], 2)} for r in rows if r["count"]]
+
+
+async def _roll_up(db, commission: Dict, sign: int) -> None:
+    """Reporte (+1) ou retire (-1) une commission du cumul mensuel par hôtel"""
+    await db.revenue_rollups.update_one(
+        {"month": commission["month"], "hotel_id": commission["hotel_id"]},
+        {"$inc": {"total": sign * commission["amount"], "hours": sign * commission["hours"], "count": sign},
+         "$set": {"hotel_name": commission.get("hotel_name")}},
+        upsert=True
+    )
+
+
+async def sync_commission(db, app: Dict, shift: Optional[Dict] = None) -> None:
+    """Enregistre la commission d'une candidature complétée et tient les cumuls à jour"""
+    if app.get("status") != "completed":
+        previous = await db.commissions.find_one_and_delete({"application_id": app["id"]})
+        if previous:
+            await _roll_up(db, previous, -1)
+        return
+    if shift is None:
+        shift = await db.shifts.find_one({"id": app["shift_id"]})
+    if not shift:
+        return
+    commission = build_commission(app, shift)
+    commission["recorded_at"] = datetime.now(timezone.utc).isoformat()
+    # Le document remplacé permet de n'appliquer que la différence aux cumuls
+    previous = await db.commissions.find_one_and_replace(
+        {"application_id": app["id"]}, commission, upsert=True, return_document=ReturnDocument.BEFORE
+    )
+    if previous:
+        await _roll_up(db, previous, -1)
+    await _roll_up(db, commission, 1)
+
+
+async def remove_shift_commissions(db, shift_id: str) -> int:
+    """Retire les commissions d'une mission supprimée et les décompte des cumuls"""
+    count = 0
+    async for commission in db.commissions.find({"shift_id": shift_id}, {"application_id": 1}):
+        previous = await db.commissions.find_one_and_delete({"application_id": commission["application_id"]})
+        if previous:
+            await _roll_up(db, previous, -1)
+            count += 1
+    return count
+
+
+async def get_revenue_summary(db, month_from: Optional[str] = None, month_to: Optional[str] = None) -> Dict:
+    """Totaux, historique mensuel et répartition par hôtel lus sur les cumuls mensuels"""
+    match = {}
+    if month_from or month_to:
+        match["month"] = {}
+        if month_from:
+            match["month"]["$gte"] = month_from
+        if month_to:
+            match["month"]["$lte"] = month_to
+    facets = await db.revenue_rollups.aggregate([
+        {"$match": match},
+        {"$facet": {
+            "totals": [{"$group": {"_id": None, "total": {"$sum": "$total"}, "hours": {"$sum": "$hours"}, "count": {"$sum": "$count"}}}],
+            "monthly": [
+                {"$group": {"_id": "$month", "total": {"$sum": "$total"}, "count": {"$sum": "$count"}}},
+                {"$sort": {"_id": -1}},
+            ],
+            "hotels": [
+                {"$group": {"_id": "$hotel_id", "hotel_name": {"$last": "$hotel_name"}, "total": {"$sum": "$total"}, "count": {"$sum": "$count"}}},
+                {"$sort": {"total": -1}},
+            ],
+        }},
+    ]).to_list(1)
+    facets = facets[0] if facets else {"totals": [], "monthly": [], "hotels": []}
+    totals = facets["totals"][0] if facets["totals"] else {"total": 0, "hours": 0, "count": 0}
+    return {
+        "total_revenue": round(totals["total"], 2),
+        "total_hours": round(totals["hours"], 2),
+        "total_missions": totals["count"],
+        "commission_rate": COMMISSION_RATE,
+        "monthly_revenue": _rounded(facets["monthly"]),
+        "revenue_by_period": _rounded(facets["monthly"]),
+        "hotel_revenue": _rounded(facets["hotels"]),
+    }
+
+
+async def get_total_revenue(db) -> float:
+    rows = await db.revenue_rollups.aggregate([{"$group": {"_id": None, "total": {"$sum": "$total"}}}]).to_list(1)
+    return round(rows[0]["total"], 2) if rows else 0
+
+
+async def backfill_commissions(db) -> int:
+    """Reconstruit commissions et cumuls à partir des candidatures complétées"""
+    await db.commissions.delete_many({})
+    await db.revenue_rollups.delete_many({})
+    count = 0
+    async for app in db.applications.find({"status": "completed"}):
+        await sync_commission(db, app)
+        count += 1
+    return count
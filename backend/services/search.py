@@ -0,0 +1,89 @@
+from typing import Dict, List, Optional
+import re
+import unicodedata
+
+# Champs indexés pour la recherche admin, par collection
+SEARCH_FIELDS: Dict[str, List[str]] = {
+    "users": ["email", "first_name", "last_name", "hotel_name"],
+    "shifts": ["title", "hotel_name"],
+    "support_threads": ["subject", "user_email"],
+    "audit_logs": ["admin_email", "target_email"],
+}
+
+# Les préfixes sont tronqués : au-delà, le préfixe suffit à discriminer
+MAX_PREFIX_LENGTH = 20
+
+_TOKEN_SPLIT = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Minuscules sans accents : 'Hôtel Étoile' -> 'hotel etoile'"""
+    folded = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in folded if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_SPLIT.split(normalize(text)) if t]
+
+
+def build_search_keys(collection: str, doc: Dict) -> Dict[str, List[str]]:
+    """Mots normalisés (pour la pertinence) et leurs préfixes (pour l'index multikey)"""
+    words = set()
+    for field in SEARCH_FIELDS[collection]:
+        value = doc.get(field)
+        if isinstance(value, str):
+            words.update(tokenize(value))
+    prefixes = {w[:i] for w in words for i in range(1, min(len(w), MAX_PREFIX_LENGTH) + 1)}
+    return {"search_words": sorted(words), "search_prefixes": sorted(prefixes)}
+
+
+def add_search_keys(collection: str, doc: Dict) -> Dict:
+    """Complète un document avant insertion ; retourne le même dict pour un usage en ligne"""
+    doc.update(build_search_keys(collection, doc))
+    return doc
+
+
+async def refresh_search_keys(db, collection: str, query: Dict, changed_fields=None) -> None:
+    """Recalcule les clés après une mise à jour qui touche un champ indexé"""
+    fields = SEARCH_FIELDS[collection]
+    if changed_fields is not None and not set(changed_fields) & set(fields):
+        return
+    doc = await db[collection].find_one(query, {f: 1 for f in fields})
+    if doc:
+        await db[collection].update_one({"_id": doc["_id"]}, {"$set": build_search_keys(collection, doc)})
+
+
+def search_terms(q: Optional[str]) -> List[str]:
+    return [t[:MAX_PREFIX_LENGTH] for t in tokenize(q or "")]
+
+
+def search_filter(terms: List[str]) -> Dict:
+    """Chaque terme saisi doit être le préfixe d'un mot indexé (requête servie par l'index)"""
+    return {"search_prefixes": {"$all": terms}} if terms else {}
+
+
+def ranked_search_pipeline(query: Dict, terms: List[str], sort: Dict, skip: int, limit: int,
+                           projection: Optional[Dict] = None) -> List[Dict]:
+    """Tri par pertinence (mots saisis en entier d'abord) puis par le tri habituel"""
+    pipeline = [
+        {"$match": query},
+        {"$addFields": {"_score": {"$size": {"$filter": {
+            "input": {"$ifNull": ["$search_words", []]}, "cond": {"$in": ["$$this", terms]},
+        }}}}},
+        {"$sort": {"_score": -1, **sort}},
+        {"$skip": skip},
+        {"$limit": limit},
+        {"$project": {"_score": 0, "search_words": 0, "search_prefixes": 0}},
+    ]
+    if projection:
+        pipeline.append({"$project": projection})
+    return pipeline
+
+
+async def backfill_search_keys(db) -> int:
+    count = 0
+    for collection, fields in SEARCH_FIELDS.items():
+        async for doc in db[collection].find({}, {f: 1 for f in fields}):
+            await db[collection].update_one({"_id": doc["_id"]}, {"$set": build_search_keys(collection, doc)})
+            count += 1
+    return count
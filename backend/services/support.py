@@ -0,0 +1,228 @@
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import uuid
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+
+from services.pagination import encode_cursor, keyset_filter, merge_filters
+from services.search import add_search_keys
+
+# Champs d'une conversation poussés aux abonnés SSE
+THREAD_EVENT_FIELDS = ["id", "user_id", "user_email", "user_role", "subject", "status", "last_message", "last_message_at",
+                       "last_sender_role", "unread_by_admin", "unread_by_user", "created_at"]
+# Compteur de messages non lus, par côté de la conversation
+UNREAD_FIELDS = {"admin": "unread_by_admin", "user": "unread_by_user"}
+
+MESSAGE_SORT_ASC = [("created_at", 1), ("id", 1)]
+MESSAGE_SORT_DESC = [("created_at", -1), ("id", -1)]
+MESSAGE_SEQ_SORT = [("seq", 1)]
+# Code renvoyé par un mongod autonome qui refuse les transactions
+ILLEGAL_OPERATION = 20
+
+
+def decode_seq(cursor: str) -> int:
+    try:
+        return max(int(cursor), 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def contiguous_seq(start: int, docs: List[Dict]) -> int:
+    """Dernier numéro atteint sans trou depuis start : un message numéroté mais pas encore visible
+    (écriture concurrente en cours) arrête le curseur, il sera renvoyé à la synchro suivante"""
+    seqs = {d["seq"] for d in docs if d.get("seq") is not None}
+    while start + 1 in seqs:
+        start += 1
+    return start
+
+
+async def get_messages_page(db, thread_id: str, since: Optional[str] = None, before: Optional[str] = None,
+                            limit: int = 500) -> Tuple[List[Dict], Dict[str, str]]:
+    """Historique d'une conversation, toujours renvoyé du plus ancien au plus récent.
+
+    since  : uniquement les messages postérieurs au curseur (synchro incrémentale)
+    before : la page de messages antérieure au curseur (chargement de l'historique)
+    sans curseur : les `limit` derniers messages
+    La synchro suit le numéro seq attribué par $inc sur la conversation, pas created_at (horodaté
+    avant l'écriture) ; les messages déjà reçus peuvent revenir, le client dédoublonne par id.
+    Retourne (messages, en-têtes X-Since-Cursor / X-Before-Cursor)"""
+    query = {"thread_id": thread_id}
+    if since:
+        after = decode_seq(since)
+        docs = await db.support_messages.find(
+            {**query, "seq": {"$gt": after}}, {"_id": 0}
+        ).sort(MESSAGE_SEQ_SORT).to_list(limit)
+        return docs, {"X-Since-Cursor": str(contiguous_seq(after, docs))}
+    docs = await db.support_messages.find(
+        merge_filters(query, keyset_filter(before, direction=-1)), {"_id": 0}
+    ).sort(MESSAGE_SORT_DESC).to_list(limit + 1)
+    has_older = len(docs) > limit
+    docs = docs[:limit][::-1]
+    headers = {}
+    if docs and not before:
+        # Seule la page la plus récente fournit le point de départ de la synchro ; les messages
+        # antérieurs à la numérotation n'ont pas de seq (départ à 0)
+        seqs = [d["seq"] for d in docs if d.get("seq") is not None]
+        headers["X-Since-Cursor"] = str(contiguous_seq(min(seqs) - 1, docs) if seqs else 0)
+    if docs and has_older:
+        headers["X-Before-Cursor"] = encode_cursor(docs[0])
+    return docs, headers
+
+
+async def in_transaction(db, operation: Callable[[Any], Awaitable]):
+    """operation(session) dans une transaction (replica set, cas d'Atlas) ; sur un mongod autonome de
+    développement, exécutée sans session dans le même ordre d'écriture"""
+    async with await db.client.start_session() as session:
+        try:
+            return await session.with_transaction(operation)
+        except OperationFailure as e:
+            if e.code != ILLEGAL_OPERATION:
+                raise
+    return await operation(None)
+
+
+def side_of(user: Dict) -> str:
+    return "admin" if user.get("role") == "admin" else "user"
+
+
+def thread_filter(thread_id: str, user: Dict, owner_only: bool = False) -> Dict:
+    """Conversation accessible : l'admin voit tout (sauf sur les routes worker/hotel), les autres leurs seules conversations"""
+    if owner_only or side_of(user) != "admin":
+        return {"id": thread_id, "user_id": user["id"]}
+    return {"id": thread_id}
+
+
+def new_message(thread_id: str, user: Dict, body: str, role: Optional[str] = None) -> Dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "thread_id": thread_id,
+        "sender_id": user["id"],
+        "sender_email": user.get("email"),
+        "sender_role": role or user.get("role"),
+        "body": body,
+        "is_admin": side_of(user) == "admin",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def message_update(message: Dict) -> Dict:
+    """Métadonnées de la conversation après un message : aperçu, statut et non-lus du côté destinataire"""
+    sender = "admin" if message["is_admin"] else "user"
+    recipient = "user" if sender == "admin" else "admin"
+    update = {
+        "$set": {
+            "last_message": message["body"][:100],
+            "last_message_at": message["created_at"],
+            "last_sender_role": message["sender_role"],
+            # Répondre vaut lecture
+            UNREAD_FIELDS[sender]: 0,
+        },
+        # message_seq : numéro du message dans la conversation, attribué au moment de l'écriture
+        "$inc": {UNREAD_FIELDS[recipient]: 1, "message_seq": 1},
+    }
+    if sender == "user":
+        update["$set"].update({"status": "in_progress", "admin_read": False})
+    return update
+
+
+async def create_thread(db, user: Dict, subject: Optional[str], body: Optional[str] = None,
+                        role: Optional[str] = None) -> Tuple[Dict, Optional[Dict]]:
+    """Crée la conversation et son premier message éventuel, dans une même transaction"""
+    thread = {
+        "id": str(uuid.uuid4()),
+        "user_id": user["id"],
+        "user_email": user["email"],
+        "user_role": role or user.get("role"),
+        "subject": subject,
+        "status": "open",
+        "unread_by_admin": 0,
+        "unread_by_user": 0,
+        "message_seq": 0,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if not body:
+        await db.support_threads.insert_one(add_search_keys("support_threads", dict(thread)))
+        return thread, None
+    message = {**new_message(thread["id"], user, body, role), "seq": 1}
+    thread.update({
+        "last_message": body[:100],
+        "last_message_at": message["created_at"],
+        "last_sender_role": message["sender_role"],
+        "unread_by_admin": 1,
+        "message_seq": 1,
+    })
+
+    async def write(session):
+        await db.support_threads.insert_one(add_search_keys("support_threads", dict(thread)), session=session)
+        await db.support_messages.insert_one(dict(message), session=session)
+
+    await in_transaction(db, write)
+    return thread, message
+
+
+async def post_message(db, thread_id: str, user: Dict, body: str, owner_only: bool = False,
+                       role: Optional[str] = None) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """Une transaction : mise à jour atomique de la conversation (contrôle d'accès, aperçu, non-lus,
+    numéro du message) puis insertion du message numéroté ; rien n'est écrit si l'une échoue.
+    Retourne (message, conversation à jour) ou (None, None)"""
+    message = new_message(thread_id, user, body, role)
+
+    async def write(session):
+        thread = await db.support_threads.find_one_and_update(
+            thread_filter(thread_id, user, owner_only), message_update(message), session=session,
+            projection={**{f: 1 for f in THREAD_EVENT_FIELDS}, "message_seq": 1}, return_document=ReturnDocument.AFTER
+        )
+        if not thread:
+            return None, None
+        doc = {**message, "seq": thread.pop("message_seq")}
+        await db.support_messages.insert_one(dict(doc), session=session)
+        return doc, thread
+
+    return await in_transaction(db, write)
+
+
+async def mark_read(db, thread_id: str, side: str) -> bool:
+    """Remet à zéro les non-lus d'un côté ; sans écriture si rien n'était en attente"""
+    field = UNREAD_FIELDS[side]
+    result = await db.support_threads.update_one({"id": thread_id, field: {"$gt": 0}}, {"$set": {field: 0}})
+    return result.modified_count > 0
+
+
+async def unread_counts(db, user: Dict) -> Dict[str, int]:
+    """Pastille de la boîte de réception : conversations et messages non lus, sans parcourir les messages"""
+    side = side_of(user)
+    field = UNREAD_FIELDS[side]
+    query = {field: {"$gt": 0}}
+    if side == "user":
+        query["user_id"] = user["id"]
+    groups = await db.support_threads.aggregate([
+        {"$match": query},
+        {"$group": {"_id": None, "threads": {"$sum": 1}, "messages": {"$sum": f"${field}"}}},
+    ]).to_list(1)
+    return {"threads": groups[0]["threads"], "messages": groups[0]["messages"]} if groups else {"threads": 0, "messages": 0}
+
+
+async def backfill_unread(db) -> int:
+    """Initialise les compteurs des conversations existantes : messages utilisateur postérieurs à la
+    dernière lecture admin, réponses admin postérieures au dernier message de l'utilisateur"""
+    count = 0
+    async for thread in db.support_threads.find({}, {"id": 1, "admin_read_at": 1}):
+        thread_id = thread.get("id")
+        query = {"thread_id": thread_id, "is_admin": {"$ne": True}}
+        if thread.get("admin_read_at"):
+            query["created_at"] = {"$gt": thread["admin_read_at"]}
+        unread_by_admin = await db.support_messages.count_documents(query)
+        last_user = await db.support_messages.find_one(
+            {"thread_id": thread_id, "is_admin": {"$ne": True}}, {"created_at": 1}, sort=[("created_at", -1)]
+        )
+        query = {"thread_id": thread_id, "is_admin": True}
+        if last_user:
+            query["created_at"] = {"$gt": last_user["created_at"]}
+        unread_by_user = await db.support_messages.count_documents(query)
+        await db.support_threads.update_one({"_id": thread["_id"]}, {"$set": {
+            "unread_by_admin": unread_by_admin, "unread_by_user": unread_by_user,
+        }})
+        count += 1
+    return count
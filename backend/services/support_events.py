@@ -0,0 +1,169 @@
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, Optional, Set
+import asyncio
+import json
+import logging
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger("myshifters")
+
+# Sujets : un par conversation, plus la boîte de réception admin (toutes les conversations)
+ADMIN_INBOX = "admin:inbox"
+HEARTBEAT_SECONDS = 15
+# InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost : reprise impossible
+UNRESUMABLE_CODES = {260, 280, 286}
+
+
+def thread_topic(thread_id: str) -> str:
+    return f"thread:{thread_id}"
+
+
+class LocalBackend:
+    """Diffusion dans le seul process courant (déploiement uvicorn mono-process)"""
+    name = "local"
+
+    def __init__(self):
+        self._deliver: Optional[Callable[[str, Dict], None]] = None
+
+    async def start(self, deliver: Callable[[str, Dict], None], resync: Callable[[], None]) -> None:
+        self._deliver = deliver
+
+    async def publish(self, topic: str, event: Dict) -> None:
+        if self._deliver:
+            self._deliver(topic, event)
+
+    async def stop(self) -> None:
+        self._deliver = None
+
+
+class MongoChangeStreamBackend:
+    """Diffusion multi-process : chaque événement est inséré dans une collection (TTL) que
+    chaque process suit par change stream (nécessite un replica set, c'est le cas sur Atlas)"""
+    name = "mongo"
+
+    def __init__(self, db, collection: str = "support_events"):
+        self.collection = db[collection]
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Callable[[str, Dict], None], resync: Callable[[], None]) -> None:
+        self._task = asyncio.create_task(self._watch(deliver, resync))
+
+    async def _watch(self, deliver: Callable[[str, Dict], None], resync: Callable[[], None]) -> None:
+        """Reprend au dernier jeton après une coupure ; si la reprise est impossible, les abonnés
+        reçoivent un resync une fois le flux rétabli (des événements ont pu être perdus)"""
+        resume_token = None
+        lost = False
+        while True:
+            try:
+                async with self.collection.watch([{"$match": {"operationType": "insert"}}],
+                                                 resume_after=resume_token) as stream:
+                    resume_token = stream.resume_token
+                    if lost:
+                        lost = False
+                        resync()
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        doc = change["fullDocument"]
+                        deliver(doc["topic"], doc["event"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Support events change stream interrupted: {e}")
+                if resume_token is None or (isinstance(e, OperationFailure) and e.code in UNRESUMABLE_CODES):
+                    resume_token = None
+                    lost = True
+                await asyncio.sleep(1)
+
+    async def publish(self, topic: str, event: Dict) -> None:
+        await self.collection.insert_one({"topic": topic, "event": event, "created_at": datetime.now(timezone.utc)})
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+
+class SupportBroker:
+    """Pub/sub en mémoire des événements support ; le backend décide de la portée (process ou cluster)"""
+
+    def __init__(self, backend=None, queue_size: int = 100):
+        self.backend = backend or LocalBackend()
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    async def start(self) -> None:
+        await self.backend.start(self._deliver, self._resync)
+
+    async def stop(self) -> None:
+        await self.backend.stop()
+
+    async def publish(self, topic: str, event: Dict) -> None:
+        self.published += 1
+        try:
+            await self.backend.publish(topic, event)
+        except Exception as e:
+            # Le push est un confort : l'écriture en base a déjà eu lieu, le client se resynchronisera
+            logger.error(f"Support event publish failed on {topic}: {e}")
+
+    def subscribe(self, *topics: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        for topic in topics:
+            self._subscribers.setdefault(topic, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        for topic in list(self._subscribers):
+            self._subscribers[topic].discard(queue)
+            if not self._subscribers[topic]:
+                del self._subscribers[topic]
+
+    def _deliver(self, topic: str, event: Dict) -> None:
+        for queue in self._subscribers.get(topic, ()):
+            try:
+                queue.put_nowait(event)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                # Client trop lent : on vide sa file et on lui demande de recharger l'historique
+                self.overflows += 1
+                self._push_resync(queue)
+
+    def _resync(self) -> None:
+        """Événements perdus côté backend : tous les abonnés rechargent leur historique"""
+        for queue in {q for queues in self._subscribers.values() for q in queues}:
+            self._push_resync(queue)
+
+    @staticmethod
+    def _push_resync(queue: asyncio.Queue) -> None:
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait({"type": "resync"})
+
+    async def stream(self, *topics: str) -> AsyncIterator[str]:
+        """Flux Server-Sent Events ; l'abonnement est libéré à la déconnexion du client"""
+        queue = self.subscribe(*topics)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Commentaire SSE : garde la connexion ouverte derrière les proxies
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event.get('type', 'message')}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+        finally:
+            self.unsubscribe(queue)
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.backend.name,
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "topics": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+        }
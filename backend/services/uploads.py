@@ -0,0 +1,156 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import io
+import logging
+import time
+import uuid
+
+import cloudinary.uploader
+
+logger = logging.getLogger("myshifters")
+
+# (collection, filtre, champ qui reçoit l'URL, champ de statut d'upload ou None)
+UploadTarget = Tuple[str, Dict, str, Optional[str]]
+
+
+class StorageBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    def store(self, data: bytes, filename: str, resource_type: Optional[str] = None) -> str:
+        """Envoie le fichier et retourne son URL publique (appelé hors de la boucle asyncio)"""
+
+
+class CloudinaryStorage(StorageBackend):
+    name = "cloudinary"
+
+    def store(self, data: bytes, filename: str, resource_type: Optional[str] = None) -> str:
+        options = {"resource_type": resource_type} if resource_type else {}
+        result = cloudinary.uploader.upload(io.BytesIO(data), **options)
+        return result.get("secure_url")
+
+
+class LocalStorage(StorageBackend):
+    """Stockage disque pour le développement local et les tests"""
+    name = "local"
+
+    def __init__(self, root: str, base_url: str):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def store(self, data: bytes, filename: str, resource_type: Optional[str] = None) -> str:
+        name = f"{uuid.uuid4().hex}{Path(filename or '').suffix}"
+        (self.root / name).write_bytes(data)
+        return f"{self.base_url}/{name}"
+
+
+class UploadService:
+    """Transferts de fichiers en tâche de fond : la requête répond dès que le fichier est reçu"""
+
+    def __init__(self, storage: StorageBackend, max_concurrency: int = 4):
+        self.storage = storage
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="upload")
+        self._tasks: Set[asyncio.Task] = set()
+        self._completed = 0
+        self._failed = 0
+        self._bytes = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+
+    async def submit(self, db, user_id: str, kind: str, file, targets: List[UploadTarget],
+                     resource_type: Optional[str] = None, on_complete: Optional[Callable[[], None]] = None) -> Dict:
+        """Lit le fichier, crée l'enregistrement 'pending' et planifie le transfert ; en cas d'échec
+        avant la planification, les cibles passent en 'failed' au lieu de rester 'pending'"""
+        try:
+            return await self._submit(db, user_id, kind, file, targets, resource_type, on_complete)
+        except Exception:
+            try:
+                await self._mark_targets(db, targets, None, "failed")
+            except Exception as e:
+                logger.error(f"Failed to mark {kind} upload targets as failed: {e}")
+            raise
+
+    async def _submit(self, db, user_id: str, kind: str, file, targets: List[UploadTarget],
+                      resource_type: Optional[str], on_complete: Optional[Callable[[], None]]) -> Dict:
+        data = await file.read()
+        job = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "kind": kind,
+            "filename": file.filename,
+            "content_type": file.content_type,
+            "size": len(data),
+            "backend": self.storage.name,
+            "status": "pending",
+            "url": None,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        await db.uploads.insert_one(dict(job))
+        task = asyncio.create_task(self._transfer(db, job, data, targets, resource_type, on_complete))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _transfer(self, db, job: Dict, data: bytes, targets: List[UploadTarget],
+                        resource_type: Optional[str], on_complete: Optional[Callable[[], None]]) -> None:
+        started = time.perf_counter()
+        try:
+            url = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.storage.store, data, job["filename"], resource_type
+            )
+            status, error = "uploaded", None
+        except Exception as e:
+            logger.error(f"Upload {job['id']} ({job['kind']}) failed: {e}")
+            url, status, error = None, "failed", str(e)
+        elapsed = time.perf_counter() - started
+        self._record(elapsed, len(data), status == "uploaded")
+        try:
+            await db.uploads.update_one({"id": job["id"]}, {"$set": {
+                "status": status, "url": url, "error": error, "duration_ms": round(elapsed * 1000, 1),
+                "completed_at": datetime.now(timezone.utc).isoformat(),
+            }})
+            await self._mark_targets(db, targets, url, status)
+            if on_complete:
+                on_complete()
+        except Exception as e:
+            logger.error(f"Failed to record upload {job['id']}: {e}")
+
+    @staticmethod
+    async def _mark_targets(db, targets: List[UploadTarget], url: Optional[str], status: str) -> None:
+        for collection, query, url_field, status_field in targets:
+            update = {url_field: url} if url else {}
+            if status_field:
+                update[status_field] = status
+            if update:
+                await db[collection].update_one(query, {"$set": update})
+
+    def _record(self, elapsed: float, size: int, ok: bool) -> None:
+        if ok:
+            self._completed += 1
+            self._bytes += size
+        else:
+            self._failed += 1
+        self._total_seconds += elapsed
+        self._max_seconds = max(self._max_seconds, elapsed)
+
+    async def drain(self, timeout: float = 30.0) -> None:
+        """Attend la fin des transferts en cours (arrêt de l'API)"""
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+
+    def stats(self) -> Dict:
+        finished = self._completed + self._failed
+        return {
+            "backend": self.storage.name,
+            "in_progress": len(self._tasks),
+            "completed": self._completed,
+            "failed": self._failed,
+            "bytes_uploaded": self._bytes,
+            "avg_ms": round(self._total_seconds / finished * 1000, 1) if finished else 0,
+            "max_ms": round(self._max_seconds * 1000, 1),
+        }
@@ -0,0 +1,52 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import time
+
+# Le hash du mot de passe n'a rien à faire en mémoire partagée
+USER_CACHE_PROJECTION = {"password_hash": 0}
+
+
+class UserCache:
+    """Cache LRU/TTL des documents utilisateur lus par get_current_user"""
+
+    def __init__(self, max_size: int = 5000, ttl_seconds: int = 60):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, db, user_id: str) -> Optional[Dict]:
+        entry = self._entries.get(user_id)
+        if entry and time.monotonic() < entry[0]:
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return dict(entry[1])
+        self.misses += 1
+        user = await db.users.find_one({"id": user_id}, USER_CACHE_PROJECTION)
+        if user:
+            self._entries[user_id] = (time.monotonic() + self.ttl_seconds, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return dict(user)
+        self._entries.pop(user_id, None)
+        return None
+
+    def invalidate(self, user_id: str) -> None:
+        """À appeler par toute route qui écrit dans db.users"""
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+        }
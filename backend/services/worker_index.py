@@ -0,0 +1,221 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import time
+
+import numpy as np
+
+from services.geo import coordinates, haversine_km
+from services.matching import WORKER_FEATURE_PROJECTION, candidate_entry, matching_scores, number, top_k
+from services.search import normalize
+
+# Champs du document utilisateur qui comptent pour l'index
+INDEXED_FIELDS = set(WORKER_FEATURE_PROJECTION) - {"_id", "id"}
+# Attributs reconstruits par load() et basculés d'un bloc
+STATE_FIELDS = ("rating", "experience", "verified", "lat", "lon", "_rows", "_profiles", "_keys", "_free",
+                "by_skill", "by_city", "by_department")
+
+
+def department_of(postal_code: Optional[str]) -> Optional[str]:
+    """'75011' -> '75' ; None si le code postal est absent ou invalide"""
+    code = str(postal_code or "").strip()
+    return code[:2] if len(code) == 5 and code[:2].isalnum() else None
+
+
+class WorkerIndex:
+    """Index mémoire des workers actifs : compétence -> lignes, villes / départements -> lignes,
+    caractéristiques numériques dans des tableaux contigus (une ligne par worker)"""
+
+    def __init__(self, max_age_seconds: int = 600, initial_capacity: int = 1024):
+        self.max_age_seconds = max_age_seconds
+        self._initial_capacity = initial_capacity
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        # Workers modifiés pendant une reconstruction (None hors reconstruction)
+        self._changed_during_load: Optional[Set[str]] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        capacity = self._initial_capacity
+        self.rating = np.zeros(capacity, dtype=np.float64)
+        self.experience = np.zeros(capacity, dtype=np.float64)
+        self.verified = np.zeros(capacity, dtype=bool)
+        self.lat = np.full(capacity, np.nan)
+        self.lon = np.full(capacity, np.nan)
+        self._rows: Dict[str, int] = {}
+        self._profiles: List[Optional[Dict]] = []
+        self._keys: List[Tuple[Tuple[str, ...], Optional[str], Optional[str]]] = []
+        self._free: List[int] = []
+        self.by_skill: Dict[str, Set[int]] = {}
+        self.by_city: Dict[str, Set[int]] = {}
+        self.by_department: Dict[str, Set[int]] = {}
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.max_age_seconds
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    async def load(self, db) -> int:
+        """Reconstruit l'index depuis db.users (démarrage, puis filet de sécurité périodique)"""
+        async with self._lock:
+            return await self._load(db)
+
+    async def ensure_loaded(self, db) -> None:
+        if self.loaded:
+            return
+        async with self._lock:
+            # Un autre appel a pu recharger pendant l'attente du verrou
+            if not self.loaded:
+                await self._load(db)
+
+    async def _load(self, db) -> int:
+        """Construit un index neuf à côté de l'index servi, puis bascule : rank() ne voit jamais un index partiel"""
+        fresh = WorkerIndex(self.max_age_seconds, self._initial_capacity)
+        self._changed_during_load = set()
+        try:
+            async for worker in db.users.find({"role": "worker", "is_suspended": {"$ne": True}}, WORKER_FEATURE_PROJECTION):
+                fresh.upsert(worker)
+            # Écritures arrivées pendant le parcours : relues avant la bascule
+            while self._changed_during_load:
+                ids = list(self._changed_during_load)
+                self._changed_during_load.clear()
+                found = set()
+                async for worker in db.users.find({"id": {"$in": ids}}, WORKER_FEATURE_PROJECTION):
+                    fresh.upsert(worker)
+                    found.add(worker.get("id"))
+                for worker_id in set(ids) - found:
+                    fresh.remove(worker_id)
+            # Bascule sans await entre les affectations : atomique pour la boucle asyncio
+            self.__dict__.update({name: getattr(fresh, name) for name in STATE_FIELDS})
+        finally:
+            self._changed_during_load = None
+        self._loaded_at = time.monotonic()
+        return len(self)
+
+    async def refresh(self, db, worker_id: str, changed_fields: Optional[Iterable[str]] = None) -> None:
+        """À appeler après toute écriture sur un utilisateur qui peut toucher son matching"""
+        if changed_fields is not None and not set(changed_fields) & INDEXED_FIELDS:
+            return
+        if self._changed_during_load is not None:
+            self._changed_during_load.add(worker_id)
+        if self._loaded_at is None:
+            return
+        worker = await db.users.find_one({"id": worker_id}, WORKER_FEATURE_PROJECTION)
+        if worker:
+            self.upsert(worker)
+        else:
+            self.remove(worker_id)
+
+    def upsert(self, worker: Dict) -> None:
+        worker_id = worker.get("id")
+        if not worker_id:
+            return
+        if self._changed_during_load is not None:
+            self._changed_during_load.add(worker_id)
+        if worker.get("role") != "worker" or worker.get("is_suspended"):
+            self.remove(worker_id)
+            return
+        row = self._rows.get(worker_id)
+        if row is None:
+            row = self._allocate(worker_id)
+        else:
+            self._unlink(row)
+        self.rating[row] = number(worker.get("rating"), 5.0)
+        self.experience[row] = number(worker.get("experience_years"), 0.0)
+        self.verified[row] = worker.get("verification_status") == "verified"
+        self.lat[row], self.lon[row] = coordinates(worker.get("location")) or (np.nan, np.nan)
+        self._profiles[row] = {k: worker.get(k) for k in ("id", "first_name", "last_name", "city")}
+        keys = (tuple(set(worker.get("skills") or [])), normalize(worker.get("city") or "").strip() or None,
+                department_of(worker.get("postal_code")))
+        self._keys[row] = keys
+        for skill in keys[0]:
+            self.by_skill.setdefault(skill, set()).add(row)
+        if keys[1]:
+            self.by_city.setdefault(keys[1], set()).add(row)
+        if keys[2]:
+            self.by_department.setdefault(keys[2], set()).add(row)
+
+    def remove(self, worker_id: str) -> None:
+        if self._changed_during_load is not None:
+            self._changed_during_load.add(worker_id)
+        row = self._rows.pop(worker_id, None)
+        if row is None:
+            return
+        self._unlink(row)
+        self._profiles[row] = None
+        self._free.append(row)
+
+    def _allocate(self, worker_id: str) -> int:
+        if self._free:
+            row = self._free.pop()
+        else:
+            row = len(self._profiles)
+            self._profiles.append(None)
+            self._keys.append(((), None, None))
+            if row >= len(self.rating):
+                # Croissance géométrique des tableaux : ajout amorti en O(1)
+                capacity = len(self.rating) * 2
+                self.rating = np.resize(self.rating, capacity)
+                self.experience = np.resize(self.experience, capacity)
+                self.verified = np.resize(self.verified, capacity)
+                self.lat = np.concatenate([self.lat, np.full(capacity - len(self.lat), np.nan)])
+                self.lon = np.concatenate([self.lon, np.full(capacity - len(self.lon), np.nan)])
+        self._rows[worker_id] = row
+        return row
+
+    def _unlink(self, row: int) -> None:
+        skills, city, department = self._keys[row]
+        for skill in skills:
+            self._discard(self.by_skill, skill, row)
+        if city:
+            self._discard(self.by_city, city, row)
+        if department:
+            self._discard(self.by_department, department, row)
+        self._keys[row] = ((), None, None)
+
+    @staticmethod
+    def _discard(buckets: Dict[str, Set[int]], key: str, row: int) -> None:
+        bucket = buckets.get(key)
+        if bucket is not None:
+            bucket.discard(row)
+            if not bucket:
+                del buckets[key]
+
+    def candidates(self, service_type: Optional[str] = None, city: Optional[str] = None,
+                   department: Optional[str] = None) -> np.ndarray:
+        """Lignes des workers qui ont la compétence et sont dans la zone (intersection des plus petits seaux d'abord)"""
+        buckets = []
+        if service_type:
+            buckets.append(self.by_skill.get(service_type, set()))
+        if city:
+            buckets.append(self.by_city.get(normalize(city).strip(), set()))
+        if department:
+            buckets.append(self.by_department.get(department, set()))
+        if not buckets:
+            return np.fromiter(self._rows.values(), dtype=np.intp, count=len(self._rows))
+        buckets.sort(key=len)
+        rows = buckets[0].intersection(*buckets[1:])
+        return np.fromiter(rows, dtype=np.intp, count=len(rows))
+
+    def rank(self, shift: Dict, k: int, city: Optional[str] = None, department: Optional[str] = None) -> List[Dict]:
+        """Top K pour un shift, en ne scorant que le sous-ensemble compétence x zone"""
+        service_type = shift.get("service_type")
+        rows = self.candidates(service_type, city, department)
+        # Sans service_type, personne ne gagne les points de compétence (comme la version scalaire)
+        skill_match = np.full(len(rows), bool(service_type))
+        origin = coordinates(shift.get("location"))
+        # Positions inconnues : NaN se propage et la distance n'est pas comptée
+        distance = haversine_km(self.lat[rows], self.lon[rows], *origin) if origin else np.full(len(rows), np.nan)
+        scores = matching_scores(skill_match, self.rating[rows], self.experience[rows], self.verified[rows], distance)
+        return [candidate_entry(self._profiles[rows[i]], scores[i], distance[i]) for i in top_k(scores, k)]
+
+    def stats(self) -> Dict:
+        return {
+            "workers": len(self),
+            "skills": len(self.by_skill),
+            "cities": len(self.by_city),
+            "departments": len(self.by_department),
+            "capacity": len(self.rating),
+            "age_seconds": round(time.monotonic() - self._loaded_at) if self._loaded_at is not None else None,
+        }
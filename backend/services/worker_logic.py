@@ -2,6 +2,8 @@ from typing import List, Dict
 import uuid
 from datetime import datetime, timezone
 
+from services.geo import distance_between
+
 class WorkerLogicService:
     @staticmethod
     def calculate_badges(worker_stats: Dict) -> List[Dict]:
@@ -40,6 +42,11 @@ class WorkerLogicService:
         # 4. Complétion du profil (10 points)
         if worker.get("verification_status") == "verified":
             score += 10
+
+        # 5. Distance (jusqu'à -10 points à 50 km et plus), si les deux positions sont connues
+        distance = distance_between(worker.get("location"), shift.get("location"))
+        if distance is not None:
+            score = max(score - min(distance / 5, 10), 0)
             
         return round(score, 1)
 
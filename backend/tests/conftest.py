@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Les services s'importent comme depuis server.py (backend/ dans le chemin)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,96 @@
+import math
+
+import numpy as np
+import pytest
+
+from services.geo import coordinates, haversine_km, point
+from services.matching import matching_scores, top_k
+from services.worker_index import WorkerIndex
+from services.worker_logic import WorkerLogicService
+
+SHIFT = {"id": "s1", "service_type": "reception", "location": point(48.8566, 2.3522)}
+
+WORKERS = [
+    # Note absente : la version scalaire compte 5.0
+    {"id": "w1", "role": "worker", "skills": ["reception"], "experience_years": 2, "verification_status": "verified",
+     "location": point(48.8566, 2.3522)},
+    {"id": "w2", "role": "worker", "skills": ["reception"], "rating": 4.2, "experience_years": 7,
+     "location": point(45.764, 4.8357)},
+    # Position inconnue : pas de pénalité de distance
+    {"id": "w3", "role": "worker", "skills": ["reception"], "rating": 3.5, "experience_years": 1,
+     "verification_status": "verified"},
+    {"id": "w4", "role": "worker", "skills": ["reception", "bar"], "rating": 4.9, "experience_years": 0,
+     "location": point(48.9, 2.4)},
+    {"id": "w5", "role": "worker", "skills": ["bar"], "rating": 5.0, "experience_years": 10,
+     "verification_status": "verified", "location": point(48.8566, 2.3522)},
+]
+
+
+def features(workers, shift):
+    """Tableaux d'entrée de matching_scores, construits comme WorkerIndex.upsert"""
+    index = WorkerIndex()
+    for worker in workers:
+        index.upsert(worker)
+    rows = np.array([index._rows[w["id"]] for w in workers])
+    skill_match = np.array([shift.get("service_type") in w.get("skills", []) for w in workers])
+    return index, rows, skill_match
+
+
+def scalar_scores(workers, shift):
+    return [WorkerLogicService.calculate_matching_score(w, shift) for w in workers]
+
+
+@pytest.mark.parametrize("shift", [SHIFT, {**SHIFT, "location": None}], ids=["distance-known", "distance-unknown"])
+def test_scores_match_scalar(shift):
+    index, rows, skill_match = features(WORKERS, shift)
+    origin = coordinates(shift.get("location"))
+    distance = haversine_km(index.lat[rows], index.lon[rows], *origin) if origin else np.full(len(rows), np.nan)
+    scores = matching_scores(skill_match, index.rating[rows], index.experience[rows], index.verified[rows], distance)
+    assert [round(float(s), 1) for s in scores] == scalar_scores(WORKERS, shift)
+
+
+def test_missing_rating_counts_as_five():
+    index, rows, skill_match = features(WORKERS[:1], {**SHIFT, "location": None})
+    scores = matching_scores(skill_match, index.rating[rows], index.experience[rows], index.verified[rows])
+    assert float(scores[0]) == WorkerLogicService.calculate_matching_score(WORKERS[0], {**SHIFT, "location": None}) == 88.0
+
+
+@pytest.mark.parametrize("k", [1, 2, 4, 10])
+def test_rank_matches_scalar_top_k(k):
+    index = WorkerIndex()
+    for worker in WORKERS:
+        index.upsert(worker)
+    ranked = index.rank(SHIFT, k)
+    eligible = [w for w in WORKERS if SHIFT["service_type"] in w["skills"]]
+    expected = sorted(scalar_scores(eligible, SHIFT), reverse=True)[:k]
+    assert [c["score"] for c in ranked] == expected
+    assert len(ranked) == min(k, len(eligible))
+
+
+def test_rank_reports_distance_only_when_known():
+    index = WorkerIndex()
+    for worker in WORKERS:
+        index.upsert(worker)
+    by_id = {c["worker_id"]: c for c in index.rank(SHIFT, 10)}
+    assert by_id["w3"]["distance_km"] is None
+    assert by_id["w1"]["distance_km"] == 0.0
+    assert by_id["w2"]["distance_km"] > 300
+
+
+def test_top_k_ties_and_large_k():
+    scores = np.array([50.0, 70.0, 70.0, 10.0, 70.0])
+    # Égalités : les k meilleurs scores sont retenus, quels que soient les indices choisis
+    assert sorted(scores[top_k(scores, 2)].tolist()) == [70.0, 70.0]
+    assert scores[top_k(scores, 4)].tolist() == [70.0, 70.0, 70.0, 50.0]
+    # k >= n : tous les indices, triés par score décroissant (tri stable entre égaux)
+    assert top_k(scores, 5).tolist() == [1, 2, 4, 0, 3]
+    assert top_k(scores, 50).tolist() == [1, 2, 4, 0, 3]
+    assert top_k(scores, 0).size == 0
+    assert top_k(np.array([]), 3).size == 0
+
+
+def test_distance_penalty_is_capped_and_floored():
+    far = np.array([1000.0, math.nan, 25.0])
+    scores = matching_scores(np.array([False, False, False]), np.array([0.0, 0.0, 0.0]),
+                             np.array([0.0, 0.0, 0.0]), np.array([True, True, True]), far)
+    assert scores.tolist() == [0.0, 10.0, 5.0]
@@ -0,0 +1,15 @@
+import axios from "axios";
+
+const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+
+// Les fichiers sont transférés en tâche de fond : on interroge /uploads/{id} jusqu'à la fin du transfert
+export async function waitForUpload(uploadId, headers, { interval = 1000, timeout = 60000 } = {}) {
+    const deadline = Date.now() + timeout;
+    while (Date.now() < deadline) {
+        const { data: job } = await axios.get(`${API}/uploads/${uploadId}`, { headers });
+        if (job.status === "uploaded") return job;
+        if (job.status === "failed") throw new Error(job.error || "Upload failed");
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+    throw new Error("Upload timed out");
+}
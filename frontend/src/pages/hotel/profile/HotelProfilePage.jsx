@@ -10,6 +10,7 @@ import { Card, CardContent, CardHeader, CardTitle } from "../../../components/ui
 import { Badge } from "../../../components/ui/badge";
 import HotelAvatar from "../components/HotelAvatar";
 import StatusBanner from "../components/StatusBanner";
+import { waitForUpload } from "../../../lib/uploads";
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
 
@@ -76,7 +77,9 @@ export default function HotelProfilePage() {
                 fd,
                 { headers: { ...getAuthHeader(), 'Content-Type': 'multipart/form-data' } }
             );
-            setUser({ ...user, avatar_url: res.data.avatar_url });
+            // L'ancienne photo reste affichée jusqu'à la fin du transfert
+            const job = await waitForUpload(res.data.upload_id, getAuthHeader());
+            setUser({ ...user, avatar_url: job.url });
             toast.success("Photo de profil mise a jour");
         } catch {
             toast.error("Erreur lors de l'upload de la photo");
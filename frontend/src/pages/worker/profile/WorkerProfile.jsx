@@ -9,6 +9,7 @@ import {
 import { useWorkerData } from "../../../hooks/useWorkerData";
 import { useAuth } from "../../../context/AuthContext";
 import { toast } from "sonner";
+import { waitForUpload } from "../../../lib/uploads";
 
 // Sous-composants
 import PersonalInfoForm from './components/PersonalInfoForm';
@@ -18,7 +19,7 @@ import PaymentInfoSection from './components/PaymentInfoSection';
 
 export default function WorkerProfile() {
     const { fetchData, putData, postData, deleteData, loading: globalLoading } = useWorkerData();
-    const { updateUserData } = useAuth();
+    const { updateUserData, getAuthHeader } = useAuth();
     
     const [profile, setProfile] = useState(null);
     const [experiences, setExperiences] = useState([]);
@@ -81,7 +82,9 @@ export default function WorkerProfile() {
         setSaving(prev => ({ ...prev, [section]: true }));
         try {
             if (section === 'profile' && isMultipart) {
-                await postData('/worker/avatar', data, true);
+                const res = await postData('/worker/avatar', data, true);
+                // Transfert en tâche de fond : on attend l'URL définitive avant de recharger le profil
+                await waitForUpload(res.upload_id, getAuthHeader());
             } else if (method === 'put') {
                 await putData(endpoint, data);
             } else if (method === 'post') {